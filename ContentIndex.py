@@ -0,0 +1,115 @@
+# File: ContentIndex.py
+# Usage: Used by Model.py
+# System: OS X
+# Dependencies: Python3
+# Description: Index of the downloaded images by Flickr photo id and by a hash
+#		of their bytes, saved under cache/. Photo ids let a search skip photos
+#		already in the library before anything is fetched; the hash catches the
+#		same image arriving under another id or URL. Entries point at file
+#		names and are only trusted while that file is still in the library;
+#		a reverse map from file name to entries keeps removing a file O(1).
+
+
+import os, json, hashlib
+from FileWriter import writeAtomic
+
+
+class ContentIndex:
+
+	PATH = os.path.join('cache', 'content-index.json')
+	TABLES = ('photos', 'hashes')
+
+	def __init__(self, path = PATH):
+		self.path = path
+		# { photoId: fileName }
+		self.photos = {}
+		# { sha1 of the bytes: fileName }
+		self.hashes = {}
+		# { fileName: {(table, key)} } of the entries pointing at each file
+		self.keys = {}
+		self.changed = False
+		self.load()
+
+	def load(self):
+		try:
+			with open(self.path, 'r') as f:
+				data = json.load(f)
+			self.photos = dict(data.get('photos', {}))
+			self.hashes = dict(data.get('hashes', {}))
+		except (OSError, ValueError, AttributeError):
+			self.photos, self.hashes = {}, {}
+		self.keys = {}
+		for table in ContentIndex.TABLES:
+			for key, fileName in getattr(self, table).items():
+				self.keys.setdefault(fileName, set()).add((table, key))
+
+	# Write the index if it changed, to a temporary name renamed into place
+	def save(self):
+		if not self.changed:
+			return
+		try:
+			os.makedirs(os.path.dirname(self.path), exist_ok=True)
+			writeAtomic(self.path, lambda f: json.dump({'photos': self.photos, 'hashes': self.hashes}, f), 'w')
+			self.changed = False
+		except OSError as e:
+			print('Could not save content index: ', e)
+
+	def hashBytes(self, data):
+		return hashlib.sha1(bytes(data)).hexdigest()
+
+	def addPhoto(self, photoId, fileName):
+		self.set('photos', photoId, fileName)
+
+	def addHash(self, digest, fileName):
+		self.set('hashes', digest, fileName)
+
+	def set(self, table, key, fileName):
+		entries = getattr(self, table)
+		old = entries.get(key)
+		if old == fileName:
+			return
+		if old is not None:
+			self.unlink(old, table, key)
+		entries[key] = fileName
+		self.keys.setdefault(fileName, set()).add((table, key))
+		self.changed = True
+
+	def unlink(self, fileName, table, key):
+		keys = self.keys.get(fileName)
+		if keys is not None:
+			keys.discard((table, key))
+			if len(keys) == 0:
+				del self.keys[fileName]
+
+	# File name of a known photo or None. exists(fileName) tells whether the
+	# file is still in the library, stale entries are dropped.
+	def findPhoto(self, photoId, exists):
+		return self.find('photos', photoId, exists)
+
+	def findHash(self, digest, exists):
+		return self.find('hashes', digest, exists)
+
+	def find(self, table, key, exists):
+		entries = getattr(self, table)
+		fileName = entries.get(key)
+		if fileName is not None and not exists(fileName):
+			del entries[key]
+			self.unlink(fileName, table, key)
+			self.changed = True
+			return None
+		return fileName
+
+	# Point the entries of a file at another one holding the same image
+	def renameFile(self, fileName, newName):
+		for table, key in list(self.keys.get(fileName, ())):
+			self.set(table, key, newName)
+
+	# Forget every entry of a file, e.g. when it is deleted
+	def removeFile(self, fileName):
+		for table, key in self.keys.pop(fileName, ()):
+			del getattr(self, table)[key]
+			self.changed = True
+
+	def removeFiles(self, fileNames):
+		for fileName in fileNames:
+			self.removeFile(fileName)
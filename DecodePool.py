@@ -0,0 +1,102 @@
+# File: DecodePool.py
+# Usage: Used by Model.py
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: Background pool that decodes and scales images off the GUI thread.
+#		Workers only touch QImage (QPixmap is not thread-safe); finished images
+#		are handed back to the GUI thread through a queued signal.
+
+
+from PyQt5.QtCore import QObject, QRunnable, QThread, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage
+
+
+# Lives in the GUI thread so emitting from a worker is delivered as a queued call
+class DecodeSignals(QObject):
+	done = pyqtSignal(object, int, QImage)
+
+
+# render(*args) returns a dict { mode: QImage } so that one decode
+# can produce several renditions of the same image
+class DecodeTask(QRunnable):
+
+	def __init__(self, signals, key, modes, render, args, priority):
+		super().__init__()
+		self.setAutoDelete(False)
+		self.signals = signals
+		self.key, self.modes = key, tuple(modes)
+		self.render, self.args = render, args
+		self.priority = priority
+
+	def run(self):
+		try:
+			images = self.render(*self.args)
+		except Exception as e:
+			print('Decode failed: ', self.key, e)
+			images = {}
+		for mode in self.modes:
+			self.signals.done.emit(self.key, mode, images.get(mode, QImage()))
+
+
+class DecodePool(QObject):
+
+	# emitted in the GUI thread with (key, mode, QImage)
+	decoded = pyqtSignal(object, int, QImage)
+
+	def __init__(self, parent = None, threads = None):
+		super().__init__(parent)
+		self.pool = QThreadPool(self)
+		self.pool.setMaxThreadCount(threads if threads else QThread.idealThreadCount())
+		self.signals = DecodeSignals(self)
+		self.signals.done.connect(self.handleDone)
+		# { (key, mode): DecodeTask } queued or running
+		self.pending = {}
+
+	# Queue render(*args) for the modes of an image that are not already queued.
+	# Higher priorities are started first; a queued request asked for again at
+	# a higher priority is moved up, e.g. a prefetched image that became visible.
+	def request(self, key, modes, render, args, priority = 0):
+		for task in {self.pending[(key, m)] for m in modes if (key, m) in self.pending}:
+			self.raisePriority(task, priority)
+		modes = [m for m in modes if (key, m) not in self.pending]
+		if len(modes) == 0:
+			return
+		task = DecodeTask(self.signals, key, modes, render, args, priority)
+		for mode in modes:
+			self.pending[(key, mode)] = task
+		self.pool.start(task, priority)
+
+	# Requeue a task that has not started yet at a higher priority
+	def raisePriority(self, task, priority):
+		if priority > task.priority and self.pool.tryTake(task):
+			task.priority = priority
+			self.pool.start(task, priority)
+
+	# Removes a queued request. Returns False if it already started
+	# or if the same decode also produces other renditions.
+	def cancel(self, key, mode):
+		task = self.pending.get((key, mode))
+		if task is not None and task.modes == (mode,) and self.pool.tryTake(task):
+			del self.pending[(key, mode)]
+			return True
+		return False
+
+	def cancelAll(self):
+		for key, mode in list(self.pending):
+			self.cancel(key, mode)
+
+	def isPending(self, key, mode):
+		return (key, mode) in self.pending
+
+	def getQueueDepth(self):
+		return len(set(self.pending.values()))
+
+	def getThreadCount(self):
+		return self.pool.maxThreadCount()
+
+	def waitForDone(self, msecs = -1):
+		return self.pool.waitForDone(msecs)
+
+	def handleDone(self, key, mode, image):
+		self.pending.pop((key, mode), None)
+		self.decoded.emit(key, mode, image)
@@ -0,0 +1,292 @@
+# File: FeatureIndex.py
+# Usage: Used by Model.py
+# System: OS X
+# Dependencies: Python3, PyQt5, NumPy (optional)
+# Description: Index of image features for finding similar images and
+#		duplicates. Each image gets a 64 bit difference hash (dHash) of its
+#		brightness and a 64 bin color histogram, computed from the small
+#		renditions the decode pool renders anyway, so originals are never
+#		decoded just for this. Images are sampled on the worker threads and
+#		their features computed in NumPy batches of BATCH images. Comparing
+#		against the whole library is one XOR & popcount over the packed
+#		hashes plus one pass over the histograms. The index is saved under
+#		cache/. Without NumPy the index stays empty and isAvailable() is False.
+
+
+import os, threading
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import Qt
+from FileWriter import writeAtomic
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+class FeatureIndex:
+
+	PATH = os.path.join('cache', 'features.npz')
+	# images sampled before their features are computed in one go
+	BATCH = 256
+	# size of the sample; 4x4 blocks of it give the 9x8 dHash grid
+	SAMPLE_WIDTH, SAMPLE_HEIGHT = 36, 32
+	# a completely different histogram counts as 32 differing hash bits
+	HIST_WEIGHT = 32 / 510
+	# at most this far apart to be reported as duplicates
+	DUPLICATE_BITS = 4
+	DUPLICATE_HIST = 64
+
+	def __init__(self, path = PATH):
+		self.path = path
+		self.lock = threading.Lock()
+		# row of every indexed image; rows of removed images are reused by nobody
+		# and dropped when the index is saved
+		self.rows = {}
+		self.names = []
+		self.count = 0
+		self.hashes = self.hists = self.stamps = self.valid = None
+		# (name, stamp, sample bytes) waiting for the next batch
+		self.pending = []
+		self.pendingNames = set()
+		self.changed = False
+		# read from disk on first use, usually by a decode worker
+		self.loaded = numpy is None
+		if numpy is not None:
+			self.hashes = numpy.zeros(0, numpy.uint64)
+			self.hists = numpy.zeros((0, 64), numpy.uint8)
+			self.stamps = numpy.zeros(0, numpy.int64)
+			self.valid = numpy.zeros(0, bool)
+
+	def isAvailable(self):
+		return numpy is not None
+
+	# Identifies the version of a file, so edited files are indexed again
+	def getStamp(self, path):
+		try:
+			st = os.stat(path)
+		except OSError:
+			return 0
+		return hash((st.st_size, st.st_mtime_ns))
+
+	def ensureLoaded(self):
+		if self.loaded:
+			return
+		with self.lock:
+			if not self.loaded:
+				self.load()
+				self.loaded = True
+
+	def has(self, name):
+		self.ensureLoaded()
+		return name in self.rows or name in self.pendingNames
+
+	def isCurrent(self, name, stamp):
+		self.ensureLoaded()
+		with self.lock:
+			row = self.rows.get(name)
+			if row is not None:
+				return int(self.stamps[row]) == stamp
+			return name in self.pendingNames
+
+	def getCount(self):
+		self.ensureLoaded()
+		return len(self.rows) + len(self.pending)
+
+	# Sample an image for the index. Called from the decode workers with any
+	# rendition of the image; the features are computed once BATCH are waiting.
+	def add(self, name, stamp, image):
+		if numpy is None or image.isNull():
+			return
+		sample = image.scaled(
+			FeatureIndex.SAMPLE_WIDTH, FeatureIndex.SAMPLE_HEIGHT, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
+		).convertToFormat(QImage.Format_RGB32)
+		bits = sample.constBits()
+		bits.setsize(sample.sizeInBytes())
+		self.ensureLoaded()
+		with self.lock:
+			if name in self.pendingNames:
+				return
+			self.pending.append((name, stamp, bytes(bits)))
+			self.pendingNames.add(name)
+			if len(self.pending) < FeatureIndex.BATCH:
+				return
+		self.flush()
+
+	# Compute the features of every image waiting
+	def flush(self):
+		with self.lock:
+			batch, self.pending = self.pending, []
+		if len(batch) == 0:
+			return
+		hashes, hists = self.computeFeatures([sample for _, _, sample in batch])
+		with self.lock:
+			for i, (name, stamp, _) in enumerate(batch):
+				self.pendingNames.discard(name)
+				row = self.rows.get(name)
+				if row is None:
+					row = self.appendRow(name)
+				self.hashes[row], self.hists[row], self.stamps[row] = hashes[i], hists[i], stamp
+			self.changed = True
+
+	# dHash and histogram of N samples at once
+	def computeFeatures(self, samples):
+		n, w, h = len(samples), FeatureIndex.SAMPLE_WIDTH, FeatureIndex.SAMPLE_HEIGHT
+		# Format_RGB32 is stored as B, G, R, 255 bytes
+		pixels = numpy.frombuffer(b''.join(samples), numpy.uint8).reshape(n, h, w, 4)
+		b, g, r = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+
+		gray = r * numpy.float32(0.299) + g * numpy.float32(0.587) + b * numpy.float32(0.114)
+		grid = gray.reshape(n, 8, h // 8, 9, w // 9).mean(axis=(2, 4))
+		bits = (grid[:, :, 1:] > grid[:, :, :-1]).reshape(n, 64)
+		hashes = numpy.packbits(bits, axis=1).view('>u8').astype(numpy.uint64).ravel()
+
+		# 4 levels per channel, 64 bins, scaled so that every histogram sums to 255
+		bins = ((r >> 6).astype(numpy.int64) << 4) | ((g >> 6) << 2) | (b >> 6)
+		bins = bins.reshape(n, w * h) + numpy.arange(n)[:, None] * 64
+		counts = numpy.bincount(bins.ravel(), minlength=n * 64).reshape(n, 64)
+		hists = (counts * 255 // (w * h)).astype(numpy.uint8)
+		return hashes, hists
+
+	def appendRow(self, name):
+		if self.count == len(self.hashes):
+			size = max(1024, 2 * self.count)
+			self.hashes = numpy.resize(self.hashes, size)
+			self.hists = numpy.resize(self.hists, (size, 64))
+			self.stamps = numpy.resize(self.stamps, size)
+			self.valid = numpy.resize(self.valid, size)
+		row = self.count
+		self.count += 1
+		self.names.append(name)
+		self.rows[name] = row
+		self.valid[row] = True
+		return row
+
+	def remove(self, name):
+		self.ensureLoaded()
+		with self.lock:
+			row = self.rows.pop(name, None)
+			if row is not None:
+				self.valid[row] = False
+				self.names[row] = None
+				self.changed = True
+			self.pendingNames.discard(name)
+			self.pending = [p for p in self.pending if p[0] != name]
+
+	# Drop the images keep(name) is False for, e.g. files deleted meanwhile
+	def prune(self, keep):
+		self.ensureLoaded()
+		with self.lock:
+			for name in [n for n in self.rows if not keep(n)]:
+				row = self.rows.pop(name)
+				self.valid[row] = False
+				self.names[row] = None
+				self.changed = True
+
+	# Distance of every row to an image, in hash bits; None if it is not indexed
+	def distances(self, name):
+		if numpy is None:
+			return None
+		self.ensureLoaded()
+		self.flush()
+		with self.lock:
+			row = self.rows.get(name)
+			if row is None:
+				return None
+			hashes, hists = self.hashes[:self.count], self.hists[:self.count]
+			bits = self.popcount(hashes ^ hashes[row])
+			hist = numpy.abs(hists.astype(numpy.int16) - hists[row]).sum(axis=1)
+			distances = bits + hist * FeatureIndex.HIST_WEIGHT
+			distances[~self.valid[:self.count]] = numpy.inf
+			return distances, bits, hist
+
+	def popcount(self, values):
+		if hasattr(numpy, 'bitwise_count'):
+			return numpy.bitwise_count(values).astype(numpy.int32)
+		return sum(POPCOUNT16[(values >> numpy.uint64(s)) & numpy.uint64(0xFFFF)] for s in (0, 16, 32, 48))
+
+	# Up to limit (name, distance) most similar to an image, closest first.
+	# include(name) tells which images may be returned.
+	def findSimilar(self, name, limit, include = None):
+		result = self.distances(name)
+		if result is None:
+			return []
+		distances = result[0]
+		distances[self.rows[name]] = numpy.inf
+		return self.closest(distances, limit, include)
+
+	# (name, distance) of the images that look the same as an image
+	def findDuplicates(self, name, include = None):
+		result = self.distances(name)
+		if result is None:
+			return []
+		distances, bits, hist = result
+		distances[(bits > FeatureIndex.DUPLICATE_BITS) | (hist > FeatureIndex.DUPLICATE_HIST)] = numpy.inf
+		distances[self.rows[name]] = numpy.inf
+		return self.closest(distances, len(distances), include)
+
+	def closest(self, distances, limit, include):
+		found = []
+		candidates = numpy.flatnonzero(numpy.isfinite(distances))
+		while len(candidates) > 0 and len(found) < limit:
+			# take a few more than needed for the ones include() rejects
+			k = min(len(candidates), 2 * (limit - len(found)) + 16)
+			part = numpy.argpartition(distances[candidates], k - 1)[:k]
+			best, candidates = candidates[part], numpy.delete(candidates, part)
+			for row in best[numpy.argsort(distances[best], kind='stable')]:
+				name = self.names[row]
+				if include is None or include(name):
+					found.append((name, float(distances[row])))
+			found.sort(key=lambda f: f[1])
+		return found[:limit]
+
+	# names ordered by their similarity to an image, images not indexed last
+	def sortBySimilarity(self, name, names):
+		result = self.distances(name)
+		if result is None:
+			return list(names)
+		# the image itself comes first, before any exact duplicates
+		distances = result[0]
+		distances[self.rows[name]] = -1
+		rows = [self.rows.get(n, -1) for n in names]
+		keys = numpy.where(numpy.array(rows) >= 0, distances[rows], numpy.inf) if len(rows) > 0 else []
+		order = numpy.argsort(keys, kind='stable')
+		return [names[i] for i in order]
+
+	def load(self):
+		try:
+			with numpy.load(self.path, allow_pickle=False) as data:
+				names = [str(n) for n in data['names']]
+				hashes, hists, stamps = data['hashes'], data['hists'], data['stamps']
+		except (OSError, ValueError, KeyError):
+			return
+		if not (len(names) == len(hashes) == len(hists) == len(stamps)):
+			return
+		self.names, self.count = names, len(names)
+		self.rows = {n: i for i, n in enumerate(names)}
+		self.hashes, self.hists = hashes.astype(numpy.uint64), hists.astype(numpy.uint8)
+		self.stamps, self.valid = stamps.astype(numpy.int64), numpy.ones(len(names), bool)
+
+	# Write the index if it changed, leaving out removed images
+	def save(self):
+		if numpy is None or not self.loaded:
+			return
+		self.flush()
+		with self.lock:
+			if not self.changed:
+				return
+			keep = numpy.flatnonzero(self.valid[:self.count])
+			names = numpy.array([self.names[i] for i in keep], dtype=str)
+			arrays = {
+				'names': names, 'hashes': self.hashes[keep], 'hists': self.hists[keep], 'stamps': self.stamps[keep]
+			}
+			self.changed = False
+		try:
+			os.makedirs(os.path.dirname(self.path), exist_ok=True)
+			writeAtomic(self.path, lambda f: numpy.savez(f, **arrays))
+		except OSError as e:
+			print('Could not save feature index: ', e)
+
+
+# bits set in every 16 bit value, for NumPy versions without bitwise_count
+POPCOUNT16 = numpy.array([bin(i).count('1') for i in range(1 << 16)], numpy.int32) if numpy is not None else None
@@ -0,0 +1,148 @@
+# File: FileWriter.py
+# Usage: Used by View.py
+# System: OS X
+# Dependencies: Python3, PyQt5, requests
+# Description: Background writer that saves files without blocking the GUI.
+#		Each file is written to a temporary name and renamed into place so a
+#		crash never leaves a half written image. A source can be raw data,
+#		a local file to copy or, as a last resort, a URL to download.
+#		writeAtomic() is that temporary-name-and-rename step on its own, used
+#		by every module that saves a file.
+
+
+import os, shutil, threading, requests
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QByteArray, pyqtSignal
+
+
+# Write path through a temporary file in the same folder that is renamed into
+# place, so nobody ever reads it half written. write(f) fills the open
+# temporary file. If keep() is given and returns False once the data is
+# written, the file is dropped and False returned. On any error the temporary
+# file is removed and the error raised.
+def writeAtomic(path, write, mode = 'wb', keep = None):
+	# unique per process & thread, ends in .tmp so scanners skip it
+	tmpPath = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+	try:
+		with open(tmpPath, mode) as f:
+			write(f)
+		if keep is not None and not keep():
+			os.remove(tmpPath)
+			return False
+		os.replace(tmpPath, path)
+		return True
+	except BaseException:
+		try:
+			os.remove(tmpPath)
+		except OSError:
+			pass
+		raise
+
+
+class WriteSignals(QObject):
+	done = pyqtSignal(object, bool, str)
+
+
+class WriteTask(QRunnable):
+
+	def __init__(self, signals, path, source, key):
+		super().__init__()
+		self.setAutoDelete(False)
+		self.signals = signals
+		self.path, self.source, self.key = path, source, key
+		# set from the GUI thread by FileWriter.cancel()
+		self.cancelled = False
+
+	def run(self):
+		keep = lambda: not self.cancelled
+		written = False
+		try:
+			if self.cancelled:
+				pass
+			elif isinstance(self.source, (bytes, QByteArray)):
+				written = writeAtomic(self.path, lambda f: f.write(bytes(self.source)), keep=keep)
+			elif self.source.startswith(('http://', 'https://')):
+				response = requests.get(self.source, stream=True, timeout=30)
+				response.raise_for_status()
+				written = writeAtomic(self.path, lambda f: [f.write(block) for block in response.iter_content(64 * 1024)], keep=keep)
+			else:
+				with open(self.source, 'rb') as source:
+					written = writeAtomic(self.path, lambda f: shutil.copyfileobj(source, f), keep=keep)
+		except (OSError, requests.RequestException) as e:
+			self.signals.done.emit(self.key, False, str(e))
+			return
+		self.signals.done.emit(self.key, written, '' if written else 'Cancelled')
+
+
+class FileWriter(QObject):
+
+	# (key, ok) for every file
+	written = pyqtSignal(object, bool)
+	# (done, total) of the current batch
+	progress = pyqtSignal(int, int)
+	# (saved, failed) when the queue is empty
+	finished = pyqtSignal(int, int)
+
+	def __init__(self, parent = None):
+		super().__init__(parent)
+		# one thread keeps the disk writes sequential
+		self.pool = QThreadPool(self)
+		self.pool.setMaxThreadCount(1)
+		self.signals = WriteSignals(self)
+		self.signals.done.connect(self.handleDone)
+		# { key: WriteTask } queued or running
+		self.tasks = {}
+		self.total, self.saved, self.failed = 0, 0, 0
+
+	# Queue a file to be written to path. key (unique while queued)
+	# is passed back in written().
+	def write(self, path, source, key = None):
+		key = key if key is not None else path
+		task = WriteTask(self.signals, path, source, key)
+		self.tasks[key] = task
+		self.total += 1
+		self.pool.start(task)
+
+	# Drop a queued or running write, e.g. because the image was deleted.
+	# Nothing is emitted for it and the file is not left behind.
+	def cancel(self, key):
+		task = self.tasks.get(key)
+		if task is None:
+			return
+		task.cancelled = True
+		if self.pool.tryTake(task):
+			del self.tasks[key]
+			self.total -= 1
+			self.finishIfIdle()
+
+	def isBusy(self):
+		return len(self.tasks) > 0
+
+	def waitForDone(self, msecs = -1):
+		return self.pool.waitForDone(msecs)
+
+	def handleDone(self, key, ok, error):
+		task = self.tasks.pop(key, None)
+		if task is not None and task.cancelled:
+			# cancelled too late to stop the rename
+			if ok:
+				try:
+					os.remove(task.path)
+				except OSError:
+					pass
+			self.total -= 1
+			self.finishIfIdle()
+			return
+		if ok:
+			self.saved += 1
+		else:
+			self.failed += 1
+			print('Could not save ', key, ': ', error)
+		self.written.emit(key, ok)
+		self.progress.emit(self.saved + self.failed, self.total)
+		self.finishIfIdle()
+
+	def finishIfIdle(self):
+		if len(self.tasks) == 0 and self.saved + self.failed > 0:
+			saved, failed = self.saved, self.failed
+			self.total, self.saved, self.failed = 0, 0, 0
+			self.finished.emit(saved, failed)
@@ -0,0 +1,98 @@
+# File: FlickrSearch.py
+# Usage: Used by View.py
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: Asynchronous Flickr photos.search client. Requests run on a
+#		QNetworkAccessManager with a timeout, a newer query cancels the one in
+#		flight and results are cached by QueryCache. Requests go through the
+#		HttpCache, and in offline mode cached results never expire. The REST
+#		endpoint is a parameter so a local stand-in server can be used instead
+#		of Flickr.
+
+
+import json, time, QueryCache, HttpCache, Stats
+from urllib.parse import quote
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5 import QtNetwork
+
+
+class FlickrSearch(QObject):
+
+	TIMEOUT_MS = 10000
+
+	# (query, photos) where photos is the list of photo dicts from the response
+	finished = pyqtSignal(str, list)
+	# (query, message)
+	failed = pyqtSignal(str, str)
+
+	def __init__(self, baseUrl, apiKey, parent = None, cache = None, timeout = TIMEOUT_MS):
+		super().__init__(parent)
+		self.baseUrl = baseUrl
+		self.apiKey = apiKey
+		self.timeout = timeout
+		if cache is None:
+			cache = QueryCache.QueryCache(ttl=None if HttpCache.http.isOffline() else QueryCache.QueryCache.TTL)
+		self.cache = cache
+		self.http = HttpCache.http
+		self.reply, self.query, self.perPage = None, None, 0
+		self.timer = QTimer(self)
+		self.timer.setSingleShot(True)
+		self.timer.timeout.connect(self.handleTimeout)
+
+	# Search for up to perPage photos. Cached results are emitted right away,
+	# otherwise any search in flight is cancelled and a new request is made.
+	def search(self, query, perPage):
+		self.cancel()
+		photos = self.cache.get(query, perPage)
+		if photos is not None:
+			self.finished.emit(query, photos)
+			return
+
+		url = self.baseUrl + '&per_page=' + str(perPage) + '&api_key=' + self.apiKey + '&text=' + quote(query)
+		self.query, self.perPage = query, int(perPage)
+		self.started = time.perf_counter()
+		self.reply = self.http.get(url)
+		self.reply.finished.connect(self.handleReply)
+		self.timer.start(self.timeout)
+
+	def cancel(self):
+		self.timer.stop()
+		if self.reply is not None:
+			reply, self.reply = self.reply, None
+			reply.finished.disconnect(self.handleReply)
+			reply.abort()
+			reply.deleteLater()
+
+	def isSearching(self):
+		return self.reply is not None
+
+	def handleTimeout(self):
+		query = self.query
+		self.cancel()
+		self.failed.emit(query, 'Search timed out.')
+
+	def handleReply(self):
+		reply = self.sender()
+		if reply is not self.reply:
+			return
+		self.timer.stop()
+		self.reply = None
+		reply.deleteLater()
+		Stats.stats.record('net.search', self.started, time.perf_counter())
+		Stats.stats.count('net.bytes', reply.bytesAvailable())
+
+		if reply.error() != QtNetwork.QNetworkReply.NoError:
+			self.failed.emit(self.query, reply.errorString())
+			return
+		try:
+			response = json.loads(bytes(reply.readAll()).decode('utf-8'))
+		except ValueError:
+			self.failed.emit(self.query, 'Invalid response.')
+			return
+
+		if response.get('stat') != 'ok':
+			self.failed.emit(self.query, response.get('message', 'No results found.'))
+			return
+		photos = response['photos']['photo']
+		self.cache.put(self.query, self.perPage, photos)
+		self.finished.emit(self.query, photos)
@@ -0,0 +1,215 @@
+# File: GridView.py
+# Usage: Used by View.py
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: Grid mode: every image of the library as a scrollable grid of
+#		thumbnails. The grid is a table of fixed size cells (image i is cell
+#		i // columns, i % columns) so Qt lays it out in constant time however
+#		large the library is, and only the cells on screen are painted. Cells
+#		are drawn by a delegate from the Model's thumbnails, which are decoded
+#		on demand as cells scroll into view and released as they scroll out.
+
+
+from PyQt5.QtWidgets import QTableView, QStyledItemDelegate, QHeaderView, QAbstractItemView
+from PyQt5.QtGui import QColor
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+
+
+class GridModel(QAbstractTableModel):
+
+	def __init__(self, model, parent = None):
+		super().__init__(parent)
+		self.model = model
+		self.count = 0
+		self.columns = 1
+
+	# Start over after images were added, removed or reordered, or the number
+	# of columns changed. Nothing is stored per cell so this is cheap.
+	def update(self, count, columns):
+		if (count, columns) == (self.count, self.columns):
+			return False
+		self.beginResetModel()
+		self.count, self.columns = count, columns
+		self.endResetModel()
+		return True
+
+	def rowCount(self, parent = QModelIndex()):
+		return 0 if parent.isValid() else (self.count + self.columns - 1) // self.columns
+
+	def columnCount(self, parent = QModelIndex()):
+		return 0 if parent.isValid() else self.columns
+
+	# Library index of a cell, or -1 for the empty cells after the last image
+	def imageAt(self, index):
+		if not index.isValid():
+			return -1
+		i = index.row() * self.columns + index.column()
+		return i if i < self.count else -1
+
+	def indexOf(self, image):
+		return self.index(image // self.columns, image % self.columns)
+
+	def flags(self, index):
+		if self.imageAt(index) < 0:
+			return Qt.NoItemFlags
+		return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+	def data(self, index, role = Qt.DisplayRole):
+		image = self.imageAt(index)
+		if image >= 0 and role == Qt.ToolTipRole:
+			return self.model.getFile(image)
+		return None
+
+
+class GridDelegate(QStyledItemDelegate):
+
+	def __init__(self, model, borderColor, selectedColor, parent = None):
+		super().__init__(parent)
+		self.model = model
+		self.borderColor = QColor(borderColor)
+		self.selectedColor = QColor(selectedColor)
+		self.background = QColor('#FFFFFF')
+
+	# Border, then the thumbnail (or its placeholder) centered in the cell
+	def paint(self, painter, option, index):
+		image = index.model().imageAt(index)
+		if image < 0:
+			return
+		b = self.model.getThumbBorder()
+		rect = option.rect
+		selected = image == self.model.getSelectedIndex()
+		painter.fillRect(rect, self.selectedColor if selected else self.borderColor)
+		inner = rect.adjusted(b, b, -b, -b)
+		painter.fillRect(inner, self.background)
+		pixmap = self.model.getPixmap(0, image)
+		painter.drawPixmap(
+			inner.x() + (inner.width() - pixmap.width()) // 2,
+			inner.y() + (inner.height() - pixmap.height()) // 2,
+			pixmap
+		)
+
+
+class GridView(QTableView):
+
+	# keys the grid handles itself, anything else goes to the View
+	NAVIGATION_KEYS = {
+		Qt.Key_Left, Qt.Key_Right, Qt.Key_Up, Qt.Key_Down,
+		Qt.Key_PageUp, Qt.Key_PageDown, Qt.Key_Home, Qt.Key_End
+	}
+
+	# (library index) the selected image changed
+	moved = pyqtSignal(int)
+	# (library index) an image was double clicked or Enter pressed on it
+	opened = pyqtSignal(int)
+
+	def __init__(self, model, parent, borderColor, selectedColor):
+		super().__init__(parent)
+		self.model = model
+		self.gridModel = GridModel(model, self)
+		self.setModel(self.gridModel)
+		self.setItemDelegate(GridDelegate(model, borderColor, selectedColor, self))
+		for header in (self.horizontalHeader(), self.verticalHeader()):
+			header.hide()
+			header.setMinimumSectionSize(1)
+			header.setSectionResizeMode(QHeaderView.Fixed)
+		self.setShowGrid(False)
+		self.setSelectionMode(QAbstractItemView.NoSelection)
+		self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+		self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+		self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+		self.setObjectName('grid')
+		self.cellSize = None
+		# selection shown by the last sync(), to scroll to it only when it moves
+		self.syncedIndex = None
+		self.verticalScrollBar().valueChanged.connect(self.updateVisibleRange)
+		self.activated.connect(self.handleActivated)
+
+	# Bring the grid up to date with the Model: cell size, number of images and
+	# the selection. Called by View.draw() while in grid mode.
+	def sync(self):
+		w, h = self.model.getThumbWidth(), self.model.getThumbHeight()
+		if self.cellSize != (w, h):
+			self.cellSize = (w, h)
+			self.horizontalHeader().setDefaultSectionSize(w)
+			self.verticalHeader().setDefaultSectionSize(h)
+			self.verticalScrollBar().setSingleStep(max(1, h // 4))
+		columns = max(1, self.viewport().width() // w)
+		reset = self.gridModel.update(self.model.getImageCount(), columns)
+
+		selected = self.model.getSelectedIndex() if self.model.getImageCount() > 0 else -1
+		if selected >= 0 and (reset or selected != self.syncedIndex):
+			index = self.gridModel.indexOf(selected)
+			if index != self.currentIndex():
+				self.setCurrentIndex(index)
+			self.scrollTo(index)
+		self.syncedIndex = selected
+		self.updateVisibleRange()
+		self.viewport().update()
+
+	# Keep the thumbnails of the rows on screen resident, the rest are released
+	def updateVisibleRange(self):
+		if self.gridModel.count == 0 or self.cellSize is None:
+			return
+		columns = self.gridModel.columns
+		first = max(0, self.rowAt(0))
+		last = self.rowAt(self.viewport().height() - 1)
+		if last < 0:
+			last = self.gridModel.rowCount() - 1
+		self.model.setVisibleRange(first * columns, (last - first + 1) * columns)
+
+	def imageDecoded(self, fileName):
+		self.viewport().update()
+
+	def resizeEvent(self, event):
+		super().resizeEvent(event)
+		if self.cellSize is not None:
+			self.sync()
+
+	def keyPressEvent(self, event):
+		if event.key() in (Qt.Key_Return, Qt.Key_Enter):
+			image = self.gridModel.imageAt(self.currentIndex())
+			if image >= 0:
+				self.opened.emit(image)
+			return
+		if event.key() not in GridView.NAVIGATION_KEYS:
+			event.ignore()
+			return
+		super().keyPressEvent(event)
+
+	# Move through the images in library order, wrapping from the end of a row
+	# to the start of the next
+	def moveCursor(self, cursorAction, modifiers):
+		count = self.gridModel.count
+		if count == 0:
+			return QModelIndex()
+		image = max(0, self.gridModel.imageAt(self.currentIndex()))
+		columns = self.gridModel.columns
+		page = columns * max(1, self.viewport().height() // self.cellSize[1])
+		steps = {
+			QAbstractItemView.MoveLeft: -1, QAbstractItemView.MovePrevious: -1,
+			QAbstractItemView.MoveRight: 1, QAbstractItemView.MoveNext: 1,
+			QAbstractItemView.MoveUp: -columns, QAbstractItemView.MoveDown: columns,
+			QAbstractItemView.MovePageUp: -page, QAbstractItemView.MovePageDown: page
+		}
+		if cursorAction == QAbstractItemView.MoveHome:
+			image = 0
+		elif cursorAction == QAbstractItemView.MoveEnd:
+			image = count - 1
+		else:
+			image = min(count - 1, max(0, image + steps.get(cursorAction, 0)))
+		return self.gridModel.indexOf(image)
+
+	def currentChanged(self, current, previous):
+		super().currentChanged(current, previous)
+		self.update(previous)
+		self.update(current)
+		image = self.gridModel.imageAt(current)
+		if image >= 0 and image != self.model.getSelectedIndex():
+			self.model.setSelectedIndex(image)
+			self.syncedIndex = image
+			self.moved.emit(image)
+
+	def handleActivated(self, index):
+		image = self.gridModel.imageAt(index)
+		if image >= 0:
+			self.opened.emit(image)
@@ -0,0 +1,77 @@
+# File: HttpCache.py
+# Usage: Used by FlickrSearch.py and ImageDownloader.py
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: One QNetworkAccessManager for the whole program, backed by a
+#		QNetworkDiskCache under cache/http. API responses and images fetched
+#		once are answered from disk while they are fresh and revalidated
+#		(If-None-Match / If-Modified-Since) once they are stale; the cache is
+#		capped at MAX_BYTES, oldest entries evicted first. In offline mode
+#		nothing goes to the network: cached responses are served however old
+#		they are and everything else fails right away.
+
+
+import os
+from PyQt5.QtCore import QUrl
+from PyQt5 import QtNetwork
+
+
+class HttpCache:
+
+	DIRECTORY = os.path.join('cache', 'http')
+	MAX_BYTES = 256 * 1024 * 1024
+
+	def __init__(self, directory = DIRECTORY, maxBytes = MAX_BYTES):
+		self.directory = directory
+		self.maxBytes = maxBytes
+		self.offline = False
+		# created on first use, once there is a QApplication
+		self.nam = None
+		self.diskCache = None
+
+	# Settings take effect for the manager created on first use
+	def configure(self, directory = None, maxBytes = None, offline = None):
+		if directory is not None:
+			self.directory = directory
+		if maxBytes is not None:
+			self.maxBytes = maxBytes
+			if self.diskCache is not None:
+				self.diskCache.setMaximumCacheSize(maxBytes)
+		if offline is not None:
+			self.offline = offline
+
+	def isOffline(self):
+		return self.offline
+
+	def getManager(self):
+		if self.nam is None:
+			self.nam = QtNetwork.QNetworkAccessManager()
+			if self.directory is not None:
+				self.diskCache = QtNetwork.QNetworkDiskCache(self.nam)
+				self.diskCache.setCacheDirectory(self.directory)
+				self.diskCache.setMaximumCacheSize(self.maxBytes)
+				self.nam.setCache(self.diskCache)
+		return self.nam
+
+	# A GET request for url that goes through the cache
+	def request(self, url):
+		request = QtNetwork.QNetworkRequest(QUrl(url))
+		if self.offline:
+			control = QtNetwork.QNetworkRequest.AlwaysCache
+		else:
+			control = QtNetwork.QNetworkRequest.PreferNetwork
+		request.setAttribute(QtNetwork.QNetworkRequest.CacheLoadControlAttribute, control)
+		return request
+
+	def get(self, url):
+		return self.getManager().get(self.request(url))
+
+	def getCacheSize(self):
+		return self.diskCache.cacheSize() if self.diskCache is not None else 0
+
+	def clear(self):
+		if self.diskCache is not None:
+			self.diskCache.clear()
+
+
+http = HttpCache()
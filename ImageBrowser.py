@@ -3,8 +3,11 @@
 # Date: September 25, 2017
 # Usage: python3 ImageBrowser.py <Window Width (int)> <Safe Mode (0/1)>
 # Usage Example 800x600 window in Safe Mode: python3 ImageBrowser.py 800 1
+# Optional flags: --stats [trace.json]	show live performance stats and write a trace on exit
+#	--no-audio	do not load the audio backend or play sounds
+#	--offline	only show searches and images that are in the HTTP cache
 # System: OS X
-# Dependencies: Python3, PyQt5, requests, Flickr API key saved in a file with a name 
+# Dependencies: Python3, PyQt5, requests, NumPy (optional), Flickr API key saved in a file with a name 
 #	prepended with 'apikey' (e.g. apikey-flickr)
 # Description: Creates an image browser that displays images as thumbnails and fullscreen.
 #	Navigation with keys and mouse. Add tags to images and save them. Search the Flickr
@@ -12,18 +15,33 @@
 #	as well as limits number of search results.
 
 
-import os, sys, View
+import os, sys, atexit, View, LibraryScanner, HttpCache, Stats
 from PyQt5.QtWidgets import QApplication
 
 # Create an image browser from the images in the 'data' folder
 if __name__ == '__main__':
 	app = QApplication(sys.argv)
 
+	# Optional flags are removed before reading the positional arguments
+	if '--stats' in sys.argv:
+		i = sys.argv.index('--stats')
+		sys.argv.pop(i)
+		traceFile = sys.argv.pop(i) if i < len(sys.argv) and sys.argv[i].endswith('.json') else 'trace.json'
+		Stats.stats.enable()
+		atexit.register(Stats.stats.dump, traceFile)
+	if '--no-audio' in sys.argv:
+		sys.argv.remove('--no-audio')
+		View.View.AUDIO = False
+	if '--offline' in sys.argv:
+		sys.argv.remove('--offline')
+		HttpCache.http.configure(offline=True)
+
 	# Open with user defined window width. Defaults to a 800x600 window.
 	windowWidth = sys.argv[1] if len(sys.argv) > 1 else 800
 
-	# Open with image files stored in 'data' directory
-	imageFiles = os.listdir('data')
+	# Open with the images stored in the 'data' directory and its subfolders,
+	# which are found while the browser starts
+	imageFiles = LibraryScanner.LibraryScanner('data').scan()
 
 	# Open in Safe Mode?
 	safeMode = False
@@ -0,0 +1,165 @@
+# File: ImageDownloader.py
+# Usage: Used by Model.py
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: Download pipeline for the images of a search. Each search is a
+#		DownloadJob; all jobs share the HttpCache's QNetworkAccessManager (and
+#		so its connections and disk cache) and at most MAX_IN_FLIGHT requests
+#		run at a time. Failed
+#		requests are retried with exponential backoff, a job can be cancelled
+#		on its own, and results are delivered in the order the URLs were given
+#		whatever order they arrive in.
+
+
+import time, HttpCache, Stats
+from collections import deque
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5 import QtNetwork
+
+
+class DownloadJob:
+
+	def __init__(self, jobId, urls, keys):
+		self.id = jobId
+		self.urls = list(urls)
+		self.keys = list(keys)
+		# { index: (data, error) } finished but not delivered yet
+		self.results = {}
+		# results delivered so far, in order
+		self.delivered = 0
+		self.failed = 0
+		self.cancelled = False
+		# anything the owner of the job wants to keep with it
+		self.added = []
+
+	def getTotal(self):
+		return len(self.urls)
+
+	def isFinished(self):
+		return self.cancelled or self.delivered == len(self.urls)
+
+
+class ImageDownloader(QObject):
+
+	MAX_IN_FLIGHT = 6
+	# attempts after the first one, waiting BACKOFF_MS, 2*BACKOFF_MS, ...
+	MAX_RETRIES = 3
+	BACKOFF_MS = 500
+	TIMEOUT_MS = 20000
+
+	# (job, index, key, data, error) for every URL of a job, in order.
+	# data is a QByteArray, or None with an error message.
+	downloaded = pyqtSignal(object, int, str, object, str)
+	# (job, done, total)
+	progress = pyqtSignal(object, int, int)
+	# (job) once every URL of a job has been delivered
+	finished = pyqtSignal(object)
+
+	def __init__(self, parent = None, maxInFlight = MAX_IN_FLIGHT, retries = MAX_RETRIES, backoff = BACKOFF_MS):
+		super().__init__(parent)
+		self.maxInFlight = maxInFlight
+		self.retries = retries
+		self.backoff = backoff
+		self.http = HttpCache.http
+		# (job, index, attempt) waiting for a free slot
+		self.queue = deque()
+		# { reply: (job, index, attempt, start time) }
+		self.inFlight = {}
+		self.nextId = 0
+
+	# Queue the URLs of a new job. keys (default: the URLs) are passed back
+	# with each result.
+	def submit(self, urls, keys = None):
+		self.nextId += 1
+		job = DownloadJob(self.nextId, urls, keys if keys is not None else urls)
+		self.queue.extend((job, i, 0) for i in range(job.getTotal()))
+		self.startRequests()
+		return job
+
+	# Stop a job: queued requests are dropped and running ones aborted.
+	# Nothing more is emitted for it.
+	def cancel(self, job):
+		if job is None or job.isFinished():
+			return
+		job.cancelled = True
+		self.queue = deque(entry for entry in self.queue if entry[0] is not job)
+		for reply, entry in list(self.inFlight.items()):
+			if entry[0] is job:
+				del self.inFlight[reply]
+				reply.finished.disconnect(self.handleReply)
+				reply.abort()
+				reply.deleteLater()
+		self.startRequests()
+
+	def isBusy(self):
+		return len(self.queue) > 0 or len(self.inFlight) > 0
+
+	def getInFlight(self):
+		return len(self.inFlight)
+
+	def startRequests(self):
+		while len(self.inFlight) < self.maxInFlight and len(self.queue) > 0:
+			job, index, attempt = self.queue.popleft()
+			request = self.http.request(job.urls[index])
+			request.setAttribute(QtNetwork.QNetworkRequest.FollowRedirectsAttribute, True)
+			if hasattr(request, 'setTransferTimeout'):
+				request.setTransferTimeout(ImageDownloader.TIMEOUT_MS)
+			reply = self.http.getManager().get(request)
+			reply.finished.connect(self.handleReply)
+			self.inFlight[reply] = (job, index, attempt, time.perf_counter())
+
+	def handleReply(self):
+		reply = self.sender()
+		entry = self.inFlight.pop(reply, None)
+		reply.deleteLater()
+		if entry is None:
+			return
+		job, index, attempt, start = entry
+		Stats.stats.record('net.image', start, time.perf_counter())
+
+		error = reply.error()
+		status = reply.attribute(QtNetwork.QNetworkRequest.HttpStatusCodeAttribute)
+		if error == QtNetwork.QNetworkReply.NoError:
+			data = reply.readAll()
+			Stats.stats.count('net.bytes', data.size())
+			self.complete(job, index, data, '')
+		elif attempt < self.retries and self.isTransient(error, status):
+			QTimer.singleShot(self.backoff * 2 ** attempt, lambda: self.retry(job, index, attempt + 1))
+		else:
+			self.complete(job, index, None, reply.errorString())
+		self.startRequests()
+
+	# Timeouts, dropped connections and server errors are worth another try,
+	# client errors such as 404 are not, nor is anything missing from the
+	# cache while offline
+	def isTransient(self, error, status):
+		if self.http.isOffline():
+			return False
+		if status is not None and 400 <= status < 500:
+			return status in (408, 429)
+		return error != QtNetwork.QNetworkReply.OperationCanceledError or status is None
+
+	def retry(self, job, index, attempt):
+		if job.cancelled:
+			return
+		Stats.stats.count('net.retries')
+		self.queue.appendleft((job, index, attempt))
+		self.startRequests()
+
+	# Deliver the results that are next in order
+	def complete(self, job, index, data, error):
+		if job.cancelled:
+			return
+		job.results[index] = (data, error)
+		while job.delivered in job.results:
+			data, error = job.results.pop(job.delivered)
+			i = job.delivered
+			job.delivered += 1
+			if data is None:
+				job.failed += 1
+			self.downloaded.emit(job, i, job.keys[i], data, error)
+			if job.cancelled:
+				return
+		self.progress.emit(job, job.delivered, job.getTotal())
+		if job.delivered == job.getTotal():
+			self.finished.emit(job)
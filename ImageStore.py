@@ -0,0 +1,167 @@
+# File: ImageStore.py
+# Usage: Used by Model.py
+# System: OS X
+# Dependencies: Python3
+# Description: Record store for the images in the library. Every image gets a
+#		stable integer id and one slotted record holding its metadata. The
+#		browsing order is an array of ids, so an image is found by id, name
+#		or position in constant time. Deleting shifts the id array in a single
+#		memmove instead of editing several Python lists, and the position
+#		index is corrected on lookup from the sorted list of removed slots
+#		until it is compacted. Search results are added as pending records
+#		and only enter the order once they arrive.
+
+
+import itertools, bisect
+from array import array
+
+
+class ImageRecord:
+
+	__slots__ = ('id', 'name', 'url', 'loaded', 'new')
+
+	def __init__(self, imageId, name, url, loaded):
+		self.id = imageId
+		self.name = name
+		# where a downloaded image came from, None for local files
+		self.url = url
+		# in the browsing order, False while a download is pending
+		self.loaded = loaded
+		# downloaded but not saved to the data folder yet
+		self.new = url is not None
+
+
+class ImageStore:
+
+	# removed slots kept before the position index is rebuilt
+	COMPACT_AFTER = 1024
+
+	def __init__(self):
+		self.nextId = itertools.count()
+		# { id: ImageRecord }
+		self.records = {}
+		# { name: id }
+		self.ids = {}
+		# ids of the loaded images in browsing order
+		self.order = array('q')
+		# { id: slot }, built on first lookup. A slot is the position an image
+		# had when the index was built (or it was appended), its position now is
+		# its slot minus the number of removed slots before it.
+		self.positions = None
+		# sorted slots of the images removed since the index was built
+		self.removed = []
+
+	# Add images, loaded right away unless they are still being downloaded.
+	# Names already in the store are skipped. Returns the ids of the new records.
+	def addBatch(self, names, urls = None, loaded = True):
+		added = []
+		for i, name in enumerate(names):
+			if name in self.ids:
+				continue
+			imageId = next(self.nextId)
+			self.records[imageId] = ImageRecord(imageId, name, urls[i] if urls is not None else None, loaded)
+			self.ids[name] = imageId
+			added.append(imageId)
+		if loaded and len(added) > 0:
+			if self.positions is not None:
+				slot = len(self.order) + len(self.removed)
+				self.positions.update((imageId, slot + i) for i, imageId in enumerate(added))
+			self.order.extend(added)
+		return added
+
+	def add(self, name, url = None, loaded = True):
+		added = self.addBatch([name], [url] if url is not None else None, loaded)
+		return added[0] if len(added) > 0 else self.ids[name]
+
+	# Append a pending image to the end of the browsing order
+	def markLoaded(self, imageId):
+		record = self.records[imageId]
+		if not record.loaded:
+			record.loaded = True
+			if self.positions is not None:
+				self.positions[imageId] = len(self.order) + len(self.removed)
+			self.order.append(imageId)
+
+	def remove(self, imageId):
+		record = self.records.pop(imageId, None)
+		if record is None:
+			return
+		del self.ids[record.name]
+		if record.loaded:
+			position = self.getPosition(imageId)
+			del self.order[position]
+			bisect.insort(self.removed, self.positions.pop(imageId))
+			if len(self.removed) > ImageStore.COMPACT_AFTER:
+				self.positions = None
+
+	# Remove many images with one pass over the order
+	def removeBatch(self, imageIds):
+		drop = set()
+		for imageId in imageIds:
+			record = self.records.pop(imageId, None)
+			if record is None:
+				continue
+			del self.ids[record.name]
+			if record.loaded:
+				drop.add(imageId)
+		if len(drop) > 0:
+			self.order = array('q', [imageId for imageId in self.order if imageId not in drop])
+			self.positions = None
+
+	def clear(self):
+		self.records, self.ids, self.order, self.positions = {}, {}, array('q'), None
+
+	def getId(self, name):
+		return self.ids.get(name)
+
+	def getRecord(self, imageId):
+		return self.records.get(imageId)
+
+	def getName(self, imageId):
+		return self.records[imageId].name
+
+	def getIdAt(self, position):
+		return self.order[position]
+
+	def getNameAt(self, position):
+		return self.records[self.order[position]].name
+
+	# Position of a loaded image in the browsing order, or None
+	def getPosition(self, imageId):
+		if self.positions is None:
+			self.positions = {imageId: i for i, imageId in enumerate(self.order)}
+			self.removed = []
+		slot = self.positions.get(imageId)
+		if slot is None:
+			return None
+		return slot - bisect.bisect_left(self.removed, slot)
+
+	def hasName(self, name):
+		return name in self.ids
+
+	def isLoaded(self, name):
+		imageId = self.ids.get(name)
+		return imageId is not None and self.records[imageId].loaded
+
+	# Number of loaded images
+	def getCount(self):
+		return len(self.order)
+
+	# Names of the loaded images in browsing order
+	def getNames(self):
+		return [self.records[imageId].name for imageId in self.order]
+
+	# { name: url } of downloaded images that have not been saved
+	def getNewImages(self):
+		return {r.name: r.url for r in self.records.values() if r.new}
+
+	def setNew(self, name, new, url = None):
+		record = self.records.get(self.ids.get(name))
+		if record is not None:
+			record.new = new
+			if url is not None:
+				record.url = url
+
+	def clearNew(self):
+		for record in self.records.values():
+			record.new = False
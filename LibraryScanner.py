@@ -0,0 +1,83 @@
+# File: LibraryScanner.py
+# Usage: Used by ImageBrowser.py
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: Finds the images of the library folder. Folders are read with
+#		os.scandir and their images yielded one at a time in natural order
+#		(img2.jpg before img10.jpg), files first and then subfolders, so the
+#		browser can show the first images while the rest are still found.
+#		Files are recognised by extension, or by their first bytes when the
+#		extension is missing or unknown. Names are relative to the library
+#		folder, e.g. 'trips/img1.jpg'.
+
+
+import os, re
+from PyQt5.QtGui import QImageReader
+
+
+class LibraryScanner:
+
+	DIGITS = re.compile(r'(\d+)')
+	# leading bytes of the image formats recognised without an extension
+	SIGNATURES = (
+		b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'BM',
+		b'II*\x00', b'MM\x00*', b'RIFF'
+	)
+	# extensions of files that are never images, skipped without being read
+	IGNORED = {'.txt', '.json', '.part', '.tmp', '.db', '.ini', '.xml', '.html'}
+
+	def __init__(self, directory, recursive = True):
+		self.directory = directory
+		self.recursive = recursive
+		self.extensions = {'.' + bytes(f).decode('ascii').lower() for f in QImageReader.supportedImageFormats()}
+
+	# Generator of the image names in the library, in natural order
+	def scan(self, subdirectory = ''):
+		path = os.path.join(self.directory, subdirectory)
+		files, folders = [], []
+		try:
+			it = os.scandir(path)
+		except OSError:
+			return
+		with it:
+			for entry in it:
+				if entry.name.startswith('.'):
+					continue
+				try:
+					if entry.is_dir(follow_symlinks=False):
+						folders.append(entry.name)
+					elif entry.is_file():
+						files.append(entry.name)
+				except OSError:
+					continue
+
+		for name in sorted(files, key=self.naturalKey):
+			if self.isImage(os.path.join(path, name)):
+				yield subdirectory + name
+		if self.recursive:
+			for name in sorted(folders, key=self.naturalKey):
+				yield from self.scan(subdirectory + name + '/')
+
+	# Sort key comparing the runs of digits in a name as numbers. Padding them
+	# to a fixed width keeps the key a plain string, which sorts much faster
+	# than a list of strings and numbers on folders of 100k files.
+	def naturalKey(self, name):
+		return LibraryScanner.DIGITS.sub(self.padDigits, name.lower())
+
+	def padDigits(self, match):
+		return match.group().rjust(20, '0')
+
+	def isImage(self, path):
+		ext = os.path.splitext(path)[1].lower()
+		if ext in self.extensions:
+			return True
+		if ext in LibraryScanner.IGNORED:
+			return False
+		try:
+			with open(path, 'rb') as f:
+				head = f.read(16)
+		except OSError:
+			return False
+		if head.startswith(b'RIFF'):
+			return head[8:12] == b'WEBP'
+		return head.startswith(LibraryScanner.SIGNATURES)
@@ -0,0 +1,199 @@
+# File: LibraryWatcher.py
+# Usage: Used by View.py
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: Keeps the browser in sync with files other programs add to,
+#		change in or remove from the data and tags folders. Folders are watched
+#		with QFileSystemWatcher for files added, removed or renamed into place.
+#		Subfolders are watched and scanned too, with names relative to the
+#		folder as LibraryScanner yields them ('trips/img1.jpg'). Files
+#		edited in place do not change their folder, so every folder is
+#		also rescanned every POLL_MS, which covers folders that cannot be
+#		watched as well. Bursts of events are coalesced: a folder is rescanned
+#		once things have been quiet for COALESCE_MS (or after MAX_DELAY_MS at
+#		the latest) and only the difference to the last scan is reported, as
+#		one batch per folder. Scans and diffs run on a worker thread so large
+#		folders never stall the GUI; only the result is applied on it.
+
+
+import os, time
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, QFileSystemWatcher, pyqtSignal
+
+
+class ScanSignals(QObject):
+	# (directory, snapshot, subfolders, added, changed, removed)
+	done = pyqtSignal(str, object, list, list, list, list)
+
+
+class ScanTask(QRunnable):
+
+	def __init__(self, signals, scan, directory, old):
+		super().__init__()
+		self.signals = signals
+		self.scan, self.directory, self.old = scan, directory, old
+
+	def run(self):
+		old = self.old
+		new, folders = self.scan(self.directory)
+		if old is None:
+			added, changed, removed = [], [], []
+		else:
+			added = [f for f in new if f not in old]
+			removed = [f for f in old if f not in new]
+			changed = [f for f in new if f in old and new[f] != old[f]]
+		self.signals.done.emit(self.directory, new, folders, added, changed, removed)
+
+
+class LibraryWatcher(QObject):
+
+	COALESCE_MS = 250
+	MAX_DELAY_MS = 2000
+	# every folder is scanned this often, 0 to only rely on folder events
+	POLL_MS = 10000
+	# files being written by this program or others
+	TEMP_SUFFIXES = ('.part', '.tmp')
+
+	# (directory, added, changed, removed) lists of file names
+	changed = pyqtSignal(str, list, list, list)
+
+	def __init__(self, directories, parent = None):
+		super().__init__(parent)
+		self.directories = list(directories)
+		# { directory: { fileName: (size, mtime) } } as of the last scan
+		self.snapshots = {}
+		# { directory: paths of its subfolders being watched }
+		self.folders = {}
+		# directories with events not scanned yet
+		self.pending = set()
+		self.firstEvent = None
+		self.watcher = QFileSystemWatcher(self)
+		self.watcher.directoryChanged.connect(self.handleDirectoryChanged)
+		self.timer = QTimer(self)
+		self.timer.setSingleShot(True)
+		self.timer.timeout.connect(self.flush)
+		self.pollTimer = QTimer(self)
+		self.pollTimer.timeout.connect(self.poll)
+		# one scan at a time, so a snapshot is never diffed twice
+		self.pool = QThreadPool(self)
+		self.pool.setMaxThreadCount(1)
+		self.signals = ScanSignals(self)
+		self.signals.done.connect(self.handleScanned)
+		# directories being scanned
+		self.scanning = set()
+		self.running = False
+
+	# Take the first snapshots and start watching
+	def start(self):
+		self.running = True
+		for directory in self.directories:
+			self.startScan(directory)
+			if os.path.isdir(directory):
+				self.watcher.addPath(directory)
+		if LibraryWatcher.POLL_MS > 0:
+			self.pollTimer.start(LibraryWatcher.POLL_MS)
+
+	def stop(self):
+		self.running = False
+		self.timer.stop()
+		self.pollTimer.stop()
+		self.pool.clear()
+		self.folders = {}
+		paths = self.watcher.directories()
+		if len(paths) > 0:
+			self.watcher.removePaths(paths)
+
+	# A folder or one of its subfolders changed
+	def handleDirectoryChanged(self, path):
+		path = os.path.abspath(path)
+		for directory in self.directories:
+			root = os.path.abspath(directory)
+			if path == root or path.startswith(root + os.sep):
+				self.schedule(directory)
+
+	def poll(self):
+		watched = self.watcher.directories()
+		for directory in self.directories:
+			# watch folders created since the last poll
+			if directory not in watched and os.path.isdir(directory):
+				self.watcher.addPath(directory)
+			self.schedule(directory)
+
+	# Wait for more events before scanning, but not longer than MAX_DELAY_MS
+	def schedule(self, directory):
+		now = time.monotonic()
+		if len(self.pending) == 0:
+			self.firstEvent = now
+		self.pending.add(directory)
+		waited = (now - self.firstEvent) * 1000
+		self.timer.start(int(max(0, min(LibraryWatcher.COALESCE_MS, LibraryWatcher.MAX_DELAY_MS - waited))))
+
+	# Rescan the folders with events. Folders still being scanned stay
+	# pending and are scanned again once that scan is done.
+	def flush(self):
+		directories, self.pending = self.pending, set()
+		for directory in self.directories:
+			if directory not in directories:
+				continue
+			if directory in self.scanning:
+				self.pending.add(directory)
+			else:
+				self.startScan(directory)
+
+	def startScan(self, directory):
+		self.scanning.add(directory)
+		self.pool.start(ScanTask(self.signals, self.scan, directory, self.snapshots.get(directory)))
+
+	# Report what changed since the last scan of a folder
+	def handleScanned(self, directory, snapshot, folders, added, changed, removed):
+		self.scanning.discard(directory)
+		self.snapshots[directory] = snapshot
+		if self.running:
+			self.watchFolders(directory, folders)
+		if len(self.pending) > 0 and not self.timer.isActive():
+			self.timer.start(LibraryWatcher.COALESCE_MS)
+		if self.running and (len(added) > 0 or len(changed) > 0 or len(removed) > 0):
+			self.changed.emit(directory, added, changed, removed)
+
+	# Watch the subfolders found by the last scan, and only those
+	def watchFolders(self, directory, folders):
+		wanted = {os.path.join(directory, folder) for folder in folders}
+		watched = self.folders.get(directory, set())
+		added = [path for path in wanted - watched if os.path.isdir(path)]
+		if len(added) > 0:
+			self.watcher.addPaths(added)
+		current = set(self.watcher.directories())
+		removed = [path for path in watched - wanted if path in current]
+		if len(removed) > 0:
+			self.watcher.removePaths(removed)
+		self.folders[directory] = wanted
+
+	def waitForDone(self, msecs = -1):
+		return self.pool.waitForDone(msecs)
+
+	# { fileName: (size, mtime) } of a folder and its subfolders, with names
+	# relative to it like LibraryScanner's ('trips/img1.jpg'), and the list of
+	# subfolders. Runs on the scan thread.
+	def scan(self, directory):
+		files, folders, queue = {}, [], ['']
+		while len(queue) > 0:
+			subdirectory = queue.pop()
+			try:
+				it = os.scandir(os.path.join(directory, subdirectory))
+			except OSError:
+				continue
+			with it:
+				for entry in it:
+					if entry.name.startswith('.') or entry.name.endswith(LibraryWatcher.TEMP_SUFFIXES):
+						continue
+					try:
+						if entry.is_dir(follow_symlinks=False):
+							folders.append(subdirectory + entry.name)
+							queue.append(subdirectory + entry.name + '/')
+							continue
+						if not entry.is_file():
+							continue
+						st = entry.stat()
+					except OSError:
+						continue
+					files[subdirectory + entry.name] = (st.st_size, st.st_mtime_ns)
+		return files, folders
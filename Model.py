@@ -8,18 +8,41 @@
 #		keep track of data state.
 
 
-import os, sys
+import os, sys, struct, atexit, shutil, tempfile, ImageStore, ContentIndex, FeatureIndex, ImageDownloader, RenditionCache, DecodePool, Stats
+from collections import OrderedDict
 from urllib.request import urlopen
 from PyQt5.QtWidgets import QLabel
-from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtGui import QPixmap, QImage, QImageReader, QColor
 from PyQt5.QtCore import *
-from PyQt5 import QtNetwork, QtCore
 		
 
 class Model(QLabel):
 
+	# thumbnails kept resident on each side of the visible strip
+	PREFETCH_MARGIN = 5
+	# upper bound for the memory held by fullscreen pixmaps
+	FULL_BYTE_BUDGET = 64 * 1024 * 1024
+	PLACEHOLDER_COLOR = '#BFC8CE'
+	# downloaded images larger than this are kept in a temp file instead of memory
+	SPOOL_BYTES = 2 * 1024 * 1024
+	# leading bytes searched for an embedded EXIF thumbnail
+	EXIF_SCAN_BYTES = 64 * 1024
+	# smallest rendition tier. Images are decoded & cached on disk at power of two
+	# tiers and scaled from there to the label size, so most window sizes reuse them.
+	MIN_TIER = 64
+	# most images listed by findSimilar()
+	SIMILAR_QTY = 50
+	# images not in the feature index yet are queued this many at a time,
+	# whenever the decode queue runs low
+	INDEX_CHUNK = 64
+	INDEX_POLL_MS = 100
+	# library files checked against the index per poll
+	INDEX_CHECKS = 2000
+
 	# when QLabel is clicked, emit a signal with an object param
 	clicked = pyqtSignal(object)
+	# (images indexed, library size) while indexFeatures() runs
+	indexProgress = pyqtSignal(int, int)
 
 	def __init__(self, parent):
 		super().__init__(parent)
@@ -27,20 +50,50 @@ class Model(QLabel):
 		self.leftmostIndex = 0
 		self.pixIndex = 0
 		self.mode = 0
-		self.images = []
-		self.imageCount = 0
+		self.thumbs = {}
+		self.residentThumbs = set()
+		self.prefetchedThumbs = set()
+		self.placeholders = {}
+		self.fulls = OrderedDict()
+		self.fullBytes = 0
+		# pixmaps made for the previous window size, shown scaled until replaced
+		self.staleThumbs = {}
+		self.staleFulls = {}
+		# no decodes are queued while the window is being resized
+		self.resizing = False
+		# nor while a navigation key is held down, see View.keyPressEvent
+		self.scrolling = False
+		self.sources = {}
+		self.spoolDir = None
+		self.prefetchMargin = Model.PREFETCH_MARGIN
+		self.fullByteBudget = Model.FULL_BYTE_BUDGET
+		# every image of the library, see ImageStore.py
+		self.store = ImageStore.ImageStore()
+		# file names shown instead of the whole library (e.g. a tag filter), or None
+		self.order = None
 		self.thumbQty = 5
 		self.view = parent
-		self.searchQty = 0
-		self.searchCount = 0
-		self.appendIndex = 0
-		self.newFiles = {}
+		# download jobs of the searches still running, oldest first
+		self.downloadJobs = []
 
 	def initModel(self, windowWidth, files, thumbQty):
+		self.cache = RenditionCache.RenditionCache()
+		self.contentIndex = ContentIndex.ContentIndex()
+		self.features = FeatureIndex.FeatureIndex()
+		atexit.register(self.features.save)
+		# names still to be checked by indexFeatures(), or None
+		self.indexQueue = None
+		self.indexedOnce = False
+		self.indexTimer = QTimer(self)
+		self.indexTimer.timeout.connect(self.indexNext)
+		self.decoder = DecodePool.DecodePool(self)
+		self.decoder.decoded.connect(self.handleDecoded)
+		self.downloader = ImageDownloader.ImageDownloader(self)
+		self.downloader.downloaded.connect(self.handleImageDownloaded)
+		self.downloader.finished.connect(self.handleDownloadFinished)
 		self.setThumbQty(thumbQty)
 		self.setDimensions(windowWidth)
 		self.setFiles(files)
-		self.generatePixmaps(files)
 		
 	# Creates a list of Models (QLabels) of <quantity> length, connected to window (QWidget)
 	def generateLabels(self, window, quantity):
@@ -49,84 +102,541 @@ class Model(QLabel):
 			labels.append(Model(window))
 		return labels	
 
-	# Creates a 2D list of thumbnail & fullscreen pixmaps from a file list
-	def generatePixmaps(self, files, remoteSrc = False):
-		thumbs = []
-		fulls = []
-		for f in files:		
-			thumb = self.resizeAndFrame('data/' + f, self.thumbWidth, self.thumbHeight, self.thumbBorder)
-			full = self.resizeAndFrame('data/' + f, self.fullWidth, self.fullHeight, self.fullBorder)
-			thumbs.append(thumb)
-			fulls.append(full)
-			self.imageCount += 1
-
-		self.images.append(thumbs)
-		self.images.append(fulls)	
-
-	# Fetch images from the web from their URL, create Pixmaps, then add to images 2D list
-	def requestImages(self, urls):
-		self.searchQty = len(urls)
-		self.nam = QtNetwork.QNetworkAccessManager()
-		self.nam.finished.connect(self.handleImageResponse)		
-		fileNames = []
-		for url in urls:		
-			k = url.rfind("/")
-			imgFileName = url[k+1:]	
-			fileNames.append(imgFileName)
-
-			req = QtNetwork.QNetworkRequest(QtCore.QUrl(url))
-			self.nam.get(req)
-		
-		return fileNames
-
-	# Handler from QNetworkAccessManager request made in requestImages()
-	# Uses raw data from response and creates Pixmaps to be displayed in Browser
-	def handleImageResponse(self, reply):
-		er = reply.error()
-		if er == QtNetwork.QNetworkReply.NoError:
-			if self.searchCount == 0:
-				self.appendIndex = self.getImageCount()-1
-
-			url_data = reply.readAll()
-			thumb = self.resizeAndFrame(url_data, self.thumbWidth, self.thumbHeight, self.thumbBorder)
-			full = self.resizeAndFrame(url_data, self.fullWidth, self.fullHeight, self.fullBorder)
-
-			self.images[0].append(thumb)
-			self.images[1].append(full)
-			self.imageCount += 1
-			self.searchCount +=1
-
-			# end of full image search
-			if self.searchQty == self.searchCount:
-				# print('new leftmost and selected: ', self.getSelectedIndex() - self.searchQty)
-				self.setLeftmostIndex(self.getImageCount() - self.searchQty)
-				self.setSelectedIndex(self.getImageCount() - self.searchQty)
-				self.searchQty, self.searchCount = 0, 0
-				if self.view.statusText is not None:
-					self.view.statusText.setText('')	
-				self.view.setFocus()
-						
-			self.view.draw()
-			self.view.initTags()
-			# self.view.statusText.setText('Success!')
-
-	# Scale image to width or height based on image orientation	& label dimensions
-	def resizeAndFrame(self, file, w, h, b):	
-		pixmap = QPixmap()	
-		if isinstance(file, str):
-			pixmap = QPixmap(file)
+	# Fetch images from the web from their URL, keep the raw data to create Pixmaps from.
+	# Files are named after the URL unless fileNames are given. Every call is a
+	# download job of its own, so a new search does not disturb earlier ones.
+	def requestImages(self, urls, fileNames = None):
+		if fileNames is None:
+			fileNames = [self.getUrlFileName(url) for url in urls]
+		job = self.downloader.submit(urls, fileNames)
+		self.downloadJobs.append(job)
+		return job
+
+	# Handler for each image of a job from ImageDownloader, in search order.
+	# Keeps raw data from response so Pixmaps can be created when displayed in Browser
+	@Stats.stats.timed('Model.handleImageDownloaded')
+	def handleImageDownloaded(self, job, index, fileName, data, error):
+		imageId = self.store.getId(fileName)
+		if imageId is None:
+			return
+		if data is None:
+			# the pending record would otherwise wait forever
+			self.forgetImage(fileName)
+			return
+
+		digest = self.contentIndex.hashBytes(data)
+		existing = self.contentIndex.findHash(digest, self.store.isLoaded)
+		if existing is not None:
+			# the same image is in the library already, under another name
+			self.store.remove(imageId)
+			self.contentIndex.renameFile(fileName, existing)
 		else:
-			pixmap.loadFromData(file)
-		
-		if pixmap.width() > pixmap.height():
-			pixmap = pixmap.scaledToWidth(w - 2*b)
-			if pixmap.height() > (h - 2*b):
-				pixmap = pixmap.scaledToHeight(h - 2*b)
+			self.contentIndex.addHash(digest, fileName)
+			self.storeSource(fileName, data)
+			self.store.markLoaded(imageId)
+			job.added.append(fileName)
+		self.view.scheduleDraw()
+
+	# End of a search: select its first image unless a newer search is running
+	def handleDownloadFinished(self, job):
+		latest = job is self.downloadJobs[-1] if len(self.downloadJobs) > 0 else True
+		if job in self.downloadJobs:
+			self.downloadJobs.remove(job)
+		if latest and len(job.added) > 0:
+			index = self.getIndex(job.added[0])
+			if index is not None:
+				self.setLeftmostIndex(index)
+				self.setSelectedIndex(index)
+		self.contentIndex.save()
+		self.view.draw()
+
+	# Stop the given download job, or all of them. Images that have not arrived
+	# are dropped from the library; returns their file names.
+	def cancelDownloads(self, job = None):
+		jobs = [job] if job is not None else list(self.downloadJobs)
+		dropped = []
+		for j in jobs:
+			self.downloader.cancel(j)
+			if j in self.downloadJobs:
+				self.downloadJobs.remove(j)
+			for fileName in j.keys[j.delivered:]:
+				if self.store.hasName(fileName) and not self.store.isLoaded(fileName):
+					self.forgetImage(fileName)
+					dropped.append(fileName)
+		self.contentIndex.save()
+		return dropped
+
+	def isDownloading(self):
+		return len(self.downloadJobs) > 0
+
+	def canFindSimilar(self):
+		return self.features.isAvailable()
+
+	def isIndexed(self, fileName):
+		return self.features.has(fileName)
+
+	# Images that look like fileName, closest first, at most SIMILAR_QTY.
+	# Only images in the feature index are compared, see indexFeatures().
+	@Stats.stats.timed('Model.findSimilar')
+	def findSimilar(self, fileName, limit = SIMILAR_QTY):
+		return [name for name, _ in self.features.findSimilar(fileName, limit, self.store.isLoaded)]
+
+	@Stats.stats.timed('Model.findDuplicates')
+	def findDuplicates(self, fileName):
+		return [name for name, _ in self.features.findDuplicates(fileName, self.store.isLoaded)]
+
+	# The images shown, most similar to fileName first
+	@Stats.stats.timed('Model.sortBySimilarity')
+	def sortBySimilarity(self, fileName):
+		return self.features.sortBySimilarity(fileName, self.getFiles() if self.order is None else self.order)
+
+	# Add the images of the library that are missing from the feature index (or
+	# changed since) by rendering their thumbnails at the lowest priority
+	def indexFeatures(self):
+		if self.indexQueue is not None or not self.features.isAvailable():
+			return
+		# images added since the last pass are only missed if never shown
+		if self.indexedOnce and self.features.getCount() >= self.store.getCount():
+			return
+		files = self.getFiles()
+		self.indexQueue, self.indexChecked, self.indexTotal = iter(files), 0, len(files)
+		self.indexTimer.start(Model.INDEX_POLL_MS)
+
+	def indexNext(self):
+		if self.decoder.getQueueDepth() >= Model.INDEX_CHUNK:
+			return
+		queued, checked, exhausted = 0, 0, False
+		for fileName in self.indexQueue:
+			self.indexChecked += 1
+			checked += 1
+			if self.store.isLoaded(fileName):
+				stamp = 0 if fileName in self.sources else self.features.getStamp('data/' + fileName)
+				if not self.features.isCurrent(fileName, stamp):
+					self.features.remove(fileName)
+					self.requestPixmap(0, fileName, -1)
+					queued += 1
+			if queued == Model.INDEX_CHUNK or checked == Model.INDEX_CHECKS:
+				break
 		else:
-			pixmap = pixmap.scaledToHeight(h - 2*b)
+			exhausted = True
+		if exhausted and self.decoder.getQueueDepth() == 0:
+			self.indexTimer.stop()
+			self.indexQueue = None
+			self.indexedOnce = True
+			# images of other runs that are gone, once the whole library is known
+			if self.view.discovery is None:
+				self.features.prune(self.store.hasName)
+			self.features.save()
+		self.indexProgress.emit(self.indexChecked, self.indexTotal)
+
+	def isIndexing(self):
+		return self.indexQueue is not None
+
+	# Last segment of an image URL
+	def getUrlFileName(self, url):
+		return url[url.rfind('/')+1:]
+
+	# Whether a photo is in the library or being downloaded, by its Flickr id or
+	# by its URL file name, which holds the photo id & secret
+	def isKnownPhoto(self, photoId, url):
+		if self.contentIndex.findPhoto(photoId, self.store.hasName) is not None:
+			return True
+		return self.store.hasName(self.getUrlFileName(url))
+
+	# Remember the file a Flickr photo is saved as, so later searches skip it
+	def registerPhoto(self, photoId, fileName):
+		self.contentIndex.addPhoto(photoId, fileName)
 
+	# fileName, or fileName with a number appended if that name is taken
+	# by an image of the library, a file in data/ or is in taken
+	def getUniqueFileName(self, fileName, taken = ()):
+		stem, ext = os.path.splitext(fileName)
+		candidate, n = fileName, 1
+		while self.store.hasName(candidate) or candidate in taken or os.path.exists('data/' + candidate):
+			n += 1
+			candidate = stem + '-' + str(n) + ext
+		return candidate
+
+	# Keep the original bytes of a downloaded image so it can be rendered and
+	# saved without fetching it again. Large images are spilled to a temp file.
+	def storeSource(self, fileName, data):
+		if data.size() <= Model.SPOOL_BYTES:
+			self.sources[fileName] = data
+			return
+		if self.spoolDir is None:
+			self.spoolDir = tempfile.mkdtemp(prefix='ImageBrowser-')
+			atexit.register(shutil.rmtree, self.spoolDir, True)
+		fd, path = tempfile.mkstemp(dir=self.spoolDir, suffix=os.path.splitext(fileName)[1])
+		with os.fdopen(fd, 'wb') as f:
+			f.write(bytes(data))
+		self.sources[fileName] = path
+
+	# Original bytes (QByteArray) or temp file path of a downloaded image, else None
+	def getSource(self, fileName):
+		return self.sources.get(fileName)
+
+	# Forget the downloaded copy of an image, e.g. once it is saved in data/
+	def releaseSource(self, fileName):
+		source = self.sources.pop(fileName, None)
+		if isinstance(source, str):
+			try:
+				os.remove(source)
+			except OSError:
+				pass
+
+	# Label (w, h, border) of thumbnail (mode 0) or fullscreen (mode 1) images
+	def getDimensions(self, mode):
+		if mode == 0:
+			return self.thumbWidth, self.thumbHeight, self.thumbBorder
+		return self.fullWidth, self.fullHeight, self.fullBorder
+
+	# Queue the thumbnail (mode 0) or fullscreen (mode 1) image of a file on the decode pool.
+	# A fullscreen decode also yields the thumbnail if it is not resident.
+	def requestPixmap(self, mode, fileName, priority = 0, withThumb = True):
+		modes = [mode]
+		if mode == 1 and withThumb and fileName not in self.thumbs:
+			modes.append(0)
+		targets = {m: self.getDimensions(m) for m in modes}
+
+		source = self.sources.get(fileName)
+		if isinstance(source, QByteArray):
+			# QByteArray copies are implicitly shared and safe to read from a worker
+			source = QByteArray(source)
+		elif source is None:
+			source = 'data/' + fileName
+		self.decoder.request(fileName, modes, self.renderRenditions, (fileName, source, targets), priority)
+
+	# Runs in the GUI thread whenever the decode pool finishes an image
+	def handleDecoded(self, fileName, mode, image):
+		if not self.store.isLoaded(fileName):
+			return
+		selected = self.getFile(self.getSelectedIndex())
+		if mode == 0 and fileName not in self.residentThumbs and fileName != selected:
+			return
+		if not image.isNull() and not self.fitsLabel(mode, image):
+			# decoded for a window size that has changed since
+			if not self.resizing and (mode == 0 or fileName == selected):
+				self.requestPixmap(mode, fileName, 1)
+			return
+		if mode == 0:
+			self.staleThumbs.pop(fileName, None)
+			self.thumbs[fileName] = QPixmap.fromImage(image)
+		else:
+			self.staleFulls.pop(fileName, None)
+			self.cacheFullPixmap(fileName, QPixmap.fromImage(image))
+		self.view.imageDecoded(fileName, mode)
+
+	# Whether an image has the size resizeAndFrame gives it for the current labels
+	def fitsLabel(self, mode, image):
+		w, h, b = self.getDimensions(mode)
+		return (
+			image.width() <= w - 2*b and image.height() <= h - 2*b
+			and (image.width() == w - 2*b or image.height() == h - 2*b)
+		)
+
+	# Relayout for a new window size. Pixmaps of the old size are kept as previews
+	# for the images on screen, scaled on the fly by getPixmap() until the new
+	# renditions are decoded once the resize settles (see setResizing()).
+	def resizeWindow(self, width, height):
+		dimensions = (self.getDimensions(0), self.getDimensions(1))
+		# the browser is laid out for a 4:3 window
+		self.setDimensions(min(width, int(height * 4 / 3)))
+		self.setWindowWidth(width)
+		self.setWindowHeight(height)
+		if dimensions == (self.getDimensions(0), self.getDimensions(1)):
+			return False
+
+		self.decoder.cancelAll()
+		stale = self.staleThumbs
+		stale.update(self.thumbs)
+		self.staleThumbs = {f: stale[f] for f in self.residentThumbs if f in stale}
+		selected = self.getFile(self.getSelectedIndex())
+		full = self.fulls.get(selected, self.staleFulls.get(selected))
+		self.staleFulls = {selected: full} if full is not None else {}
+		self.thumbs = {}
+		self.fulls = OrderedDict()
+		self.fullBytes = 0
+		return True
+
+	def setResizing(self, resizing):
+		self.resizing = resizing
+	def isResizing(self):
+		return self.resizing
+	def setScrolling(self, scrolling):
+		self.scrolling = scrolling
+	def isScrolling(self):
+		return self.scrolling
+
+	# Images on screen are only decoded once the window size and selection settle
+	def decodesPaused(self):
+		return self.resizing or self.scrolling
+
+	# Old size pixmap of an image scaled to the current label, or None
+	def getPreview(self, mode, fileName):
+		stale = self.staleThumbs if mode == 0 else self.staleFulls
+		pixmap = stale.get(fileName)
+		if pixmap is None or self.fitsLabel(mode, pixmap):
+			return pixmap
+		w, h, b = self.getDimensions(mode)
+		pixmap = pixmap.scaled(w - 2*b, h - 2*b, Qt.KeepAspectRatio, Qt.FastTransformation)
+		stale[fileName] = pixmap
 		return pixmap
 
+	# Solid pixmap shown until the decoded image arrives
+	def getPlaceholder(self, mode):
+		w, h, b = self.getDimensions(mode)
+		key = (mode, w, h, b)
+		if key not in self.placeholders:
+			pixmap = QPixmap(w - 2*b, h - 2*b)
+			pixmap.fill(QColor(Model.PLACEHOLDER_COLOR))
+			self.placeholders[key] = pixmap
+		return self.placeholders[key]
+
+	# Keep thumbnails resident only for the visible strip plus a prefetch margin.
+	# Visible thumbnails are decoded before the ones in the margin.
+	def setVisibleRange(self, leftmost, quantity):
+		count = self.getImageCount()
+		if count == 0:
+			return
+		visible = [self.getFile((leftmost + i) % count) for i in range(min(quantity, count))]
+		resident = set(visible) | self.prefetchedThumbs
+		for i in range(1, self.prefetchMargin + 1):
+			if len(resident) == count:
+				break
+			resident.add(self.getFile((leftmost - i) % count))
+			resident.add(self.getFile((leftmost + quantity - 1 + i) % count))
+
+		for fileName in self.residentThumbs - resident:
+			self.thumbs.pop(fileName, None)
+			self.staleThumbs.pop(fileName, None)
+			self.decoder.cancel(fileName, 0)
+		self.residentThumbs = resident
+		if self.decodesPaused():
+			return
+		for fileName in resident:
+			if fileName not in self.thumbs:
+				self.requestPixmap(0, fileName, 1 if fileName in visible else 0)
+
+	# Warm the renditions of images likely to be shown next, below the priority of
+	# anything visible. Returns the (fileName, mode) requests that were queued.
+	def prefetch(self, mode, indices):
+		count = self.getImageCount()
+		names = []
+		for i in indices:
+			fileName = self.getFile(i % count)
+			if fileName not in names:
+				names.append(fileName)
+
+		queued = []
+		if mode == 0:
+			self.prefetchedThumbs = set(names)
+			self.residentThumbs |= self.prefetchedThumbs
+			for fileName in names:
+				if fileName not in self.thumbs:
+					self.requestPixmap(0, fileName, 0)
+					queued.append((fileName, 0))
+		else:
+			for fileName in names:
+				if fileName not in self.fulls:
+					self.requestPixmap(1, fileName, 1, withThumb=False)
+					queued.append((fileName, 1))
+		return queued
+
+	# Cancel prefetch requests that have not started decoding yet
+	def cancelPrefetch(self, queued):
+		for fileName, mode in queued:
+			self.decoder.cancel(fileName, mode)
+		self.prefetchedThumbs = set()
+
+	def isDecoding(self, fileName, mode):
+		return self.decoder.isPending(fileName, mode)
+
+	# Add a fullscreen pixmap to the LRU, evicting the least recently used over budget
+	def cacheFullPixmap(self, fileName, pixmap):
+		self.fulls[fileName] = pixmap
+		self.fullBytes += self.pixmapBytes(pixmap)
+		while self.fullBytes > self.fullByteBudget and len(self.fulls) > 1:
+			_, old = self.fulls.popitem(last=False)
+			self.fullBytes -= self.pixmapBytes(old)
+
+	def pixmapBytes(self, pixmap):
+		return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+	# Drop every resident pixmap of an image
+	def releasePixmaps(self, fileName):
+		self.decoder.cancel(fileName, 0)
+		self.decoder.cancel(fileName, 1)
+		self.residentThumbs.discard(fileName)
+		self.thumbs.pop(fileName, None)
+		full = self.fulls.pop(fileName, None)
+		if full is not None:
+			self.fullBytes -= self.pixmapBytes(full)
+
+	# Creates every requested rendition { mode: (w, h, b) } of a file path or
+	# raw data from a single decode. The image is decoded at the power of two
+	# tier of each rendition, then scaled to the label. Tiers of local files are
+	# read from the disk cache when possible and cached after a miss.
+	# Runs on a decode pool worker.
+	def renderRenditions(self, fileName, file, targets):
+		path = file if isinstance(file, str) else None
+		tiers, missing = {}, []
+		for tier in set(self.getTier(w, h, b) for w, h, b in targets.values()):
+			image = self.cache.get(path, tier, tier, 0) if path is not None else None
+			if image is None:
+				missing.append(tier)
+			else:
+				tiers[tier] = image
+
+		# decode once for the largest tier, smaller ones are scaled from it
+		decoded = None
+		for tier in sorted(missing, reverse=True):
+			image = self.resizeAndFrame(file if decoded is None else decoded, tier, tier, 0)
+			if decoded is None:
+				decoded = image
+			if path is not None and not image.isNull():
+				self.cache.put(path, tier, tier, 0, image)
+			tiers[tier] = image
+
+		images = {}
+		for mode, (w, h, b) in targets.items():
+			image = tiers[self.getTier(w, h, b)]
+			images[mode] = image if image.isNull() else self.resizeAndFrame(image, w, h, b, Qt.SmoothTransformation)
+
+		# the smallest rendition is plenty for the similarity features
+		if self.features.isAvailable() and not self.features.has(fileName):
+			# downloaded images are stamped 0 until they are saved
+			stamp = self.features.getStamp(path) if path == 'data/' + fileName else 0
+			self.features.add(fileName, stamp, tiers[min(tiers)])
+		return images
+
+	# Smallest power of two square that holds the image area of a label
+	def getTier(self, w, h, b):
+		tier = Model.MIN_TIER
+		while tier < max(w, h) - 2*b:
+			tier *= 2
+		return tier
+
+	# Size of a width x height image fitted to a w x h label with border b
+	def fitSize(self, width, height, w, h, b):
+		if width > height:
+			fw = w - 2*b
+			fh = int(height * fw / width)
+			if fh > (h - 2*b):
+				fh = h - 2*b
+				fw = int(width * fh / height)
+		else:
+			fh = h - 2*b
+			fw = int(width * fh / height)
+		return QSize(max(fw, 1), max(fh, 1))
+
+	# Decode a file path or raw data directly at the size it will be displayed at
+	# when it is smaller than the original. JPEGs use libjpeg's scaled decoding,
+	# or their embedded EXIF thumbnail when that is large enough.
+	def decodeImage(self, file, w, h, b):
+		buffer = None
+		if isinstance(file, str):
+			reader = QImageReader(file)
+		else:
+			buffer = QBuffer()
+			buffer.setData(QByteArray(file))
+			buffer.open(QIODevice.ReadOnly)
+			reader = QImageReader(buffer)
+
+		size = reader.size()
+		if size.isValid() and size.width() > 0 and size.height() > 0:
+			target = self.fitSize(size.width(), size.height(), w, h, b)
+			if target.width() < size.width() and target.height() < size.height():
+				if bytes(reader.format()) in (b'jpeg', b'jpg'):
+					thumb = self.readExifThumbnail(file, size, target)
+					if thumb is not None:
+						return thumb
+				reader.setScaledSize(target)
+		return reader.read()
+
+	# Returns the EXIF thumbnail of a JPEG if it is at least target sized and
+	# has the same aspect ratio as the full image, else None
+	def readExifThumbnail(self, file, size, target):
+		if isinstance(file, str):
+			try:
+				with open(file, 'rb') as f:
+					data = f.read(Model.EXIF_SCAN_BYTES)
+			except OSError:
+				return None
+		else:
+			data = bytes(QByteArray(file).left(Model.EXIF_SCAN_BYTES))
+
+		jpeg = self.findExifThumbnail(data)
+		if jpeg is None:
+			return None
+		thumb = QImage.fromData(jpeg, 'JPG')
+		if thumb.isNull() or thumb.width() < target.width() or thumb.height() < target.height():
+			return None
+		if abs(thumb.width() / thumb.height() - size.width() / size.height()) > 0.02:
+			return None
+		return thumb
+
+	# Walks the JPEG markers to the EXIF (APP1) segment and returns the bytes of
+	# the JPEG thumbnail referenced from its second IFD, or None
+	def findExifThumbnail(self, data):
+		if data[:2] != b'\xff\xd8':
+			return None
+		pos = 2
+		try:
+			while pos + 4 <= len(data) and data[pos] == 0xFF:
+				marker = data[pos+1]
+				length = struct.unpack('>H', data[pos+2:pos+4])[0]
+				if marker == 0xDA:
+					return None
+				if marker == 0xE1 and data[pos+4:pos+10] == b'Exif\x00\x00':
+					tiff = data[pos+10:pos+2+length]
+					endian = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+					if endian is None:
+						return None
+					ifd0 = struct.unpack(endian + 'I', tiff[4:8])[0]
+					count = struct.unpack(endian + 'H', tiff[ifd0:ifd0+2])[0]
+					ifd1 = struct.unpack(endian + 'I', tiff[ifd0+2+12*count:ifd0+6+12*count])[0]
+					if ifd1 == 0:
+						return None
+					count = struct.unpack(endian + 'H', tiff[ifd1:ifd1+2])[0]
+					offset, thumbLength = None, None
+					for i in range(count):
+						entry = ifd1 + 2 + 12*i
+						tag = struct.unpack(endian + 'H', tiff[entry:entry+2])[0]
+						value = struct.unpack(endian + 'I', tiff[entry+8:entry+12])[0]
+						if tag == 0x0201:
+							offset = value
+						elif tag == 0x0202:
+							thumbLength = value
+					if offset is None or thumbLength is None or offset + thumbLength > len(tiff):
+						return None
+					return tiff[offset:offset+thumbLength]
+				pos += 2 + length
+		except struct.error:
+			return None
+		return None
+
+	# Scale image to width or height based on image orientation	& label dimensions.
+	# Accepts a file path, raw data or an already decoded QImage and
+	# works on QImage so that it can run on a decode pool worker.
+	def resizeAndFrame(self, file, w, h, b, transform = Qt.FastTransformation):	
+		if isinstance(file, QImage):
+			image = file
+		else:
+			with Stats.stats.timer('Model.resizeAndFrame.decode'):
+				image = self.decodeImage(file, w, h, b)
+		if image.isNull():
+			return image
+		
+		with Stats.stats.timer('Model.resizeAndFrame.scale'):
+			if image.width() > image.height():
+				image = image.scaledToWidth(w - 2*b, transform)
+				if image.height() > (h - 2*b):
+					image = image.scaledToHeight(h - 2*b, transform)
+			else:
+				image = image.scaledToHeight(h - 2*b, transform)
+
+		return image
+
 	# Scales everything that is displayed according to window width
 	def setDimensions(self, windowWidth):
 		self.setWindowWidth	( int(windowWidth) )
@@ -152,8 +662,40 @@ class Model(QLabel):
 	def setThumbQty(self, qty):
 		self.thumbQty = qty;
 
+	# Pixmaps are decoded on demand in the background; a placeholder is returned
+	# until they arrive. Thumbnails outside the visible range and least recently
+	# used fullscreen pixmaps are released again.
 	def getPixmap(self, mode, index):
-		return self.images[mode][index]
+		fileName = self.getFile(index)
+		if mode == 0:
+			pixmap = self.thumbs.get(fileName)
+			if pixmap is None:
+				self.residentThumbs.add(fileName)
+				if not self.decodesPaused():
+					self.requestPixmap(0, fileName, 1)
+				preview = self.getPreview(0, fileName)
+				return preview if preview is not None else self.getPlaceholder(0)
+			return pixmap
+
+		pixmap = self.fulls.get(fileName)
+		if pixmap is None:
+			if not self.decodesPaused():
+				self.requestPixmap(1, fileName, 2)
+			preview = self.getPreview(1, fileName)
+			if preview is None and self.scrolling:
+				preview = self.getThumbPreview(fileName)
+			return preview if preview is not None else self.getPlaceholder(1)
+		self.fulls.move_to_end(fileName)
+		return pixmap
+
+	# Resident thumbnail of an image scaled up to the fullscreen label, or None.
+	# Cheap enough to make for every image passed while scrolling.
+	def getThumbPreview(self, fileName):
+		pixmap = self.thumbs.get(fileName)
+		if pixmap is None:
+			return None
+		w, h, b = self.getDimensions(1)
+		return pixmap.scaled(w - 2*b, h - 2*b, Qt.KeepAspectRatio, Qt.FastTransformation)
 	def setPixIndex(self, i):
 		self.pixIndex = i
 	def getPixIndex(self):
@@ -214,38 +756,117 @@ class Model(QLabel):
 		self.mode = mode
 	def getFile(self, index):
 		if index < self.getImageCount():
-			return self.files[index]	
+			if self.order is not None:
+				return self.order[index]
+			return self.store.getNameAt(index)
+	# Names of the loaded images in library order
 	def getFiles(self):
-		return self.files
+		return self.store.getNames()
+	def hasFile(self, fileName):
+		return self.store.isLoaded(fileName)
+	def getImageId(self, fileName):
+		return self.store.getId(fileName)
+	# Position of a loaded image in the whole library, or None
+	def getLibraryIndex(self, fileName):
+		imageId = self.store.getId(fileName)
+		return self.store.getPosition(imageId) if imageId is not None else None
+
+	# Index of a file among the images shown, or None
+	def getIndex(self, fileName):
+		if self.order is not None:
+			return self.order.index(fileName) if fileName in self.order else None
+		return self.getLibraryIndex(fileName)
+
+	# Loaded file names in library order, without scanning the library
+	# once the position index is built
+	def sortByPosition(self, fileNames):
+		positions = [(self.getLibraryIndex(f), f) for f in fileNames]
+		return [f for _, f in sorted(p for p in positions if p[0] is not None)]
+
+	# Show only the given file names, in that order. None shows the whole library.
+	def setOrder(self, fileNames):
+		self.order = list(fileNames) if fileNames is not None else None
+		self.setLeftmostIndex(0)
+		self.setSelectedIndex(0)
+	def getOrder(self):
+		return self.order
+	def isFiltered(self):
+		return self.order is not None
+	# Replace the library with the given files, skipping hidden ones
 	def setFiles(self, files):
-		for i, f in enumerate(files):
-			if f.rfind('.') == 0:
-				# print('Deleted hidden file: ', f)
-				del files[i]
-		self.files = files
+		self.store.clear()
+		self.store.addBatch([f for f in files if not f.startswith('.')])
+	# Append local files to the library, skipping hidden ones
+	def addLocalFiles(self, files):
+		return self.store.addBatch([f for f in files if not f.startswith('.')])
+	# Images being downloaded, shown once they arrive
 	def addFiles(self, files, urls = None):
-		for i, file in enumerate(files):
-			self.files.append(file)
-			if urls != None:
-				self.newFiles[file] = urls[i]
+		self.store.addBatch(files, urls, loaded=False)
+	def addNewFile(self, file, url):
+		self.store.setNew(file, True, url)
+	def clearNewFile(self, file):
+		self.store.setNew(file, False)
 	def clearNewFiles(self):
-		self.newFiles = {}
+		self.store.clearNew()
 	def getNewFiles(self):
-		return self.newFiles
+		return self.store.getNewImages()
+
+	def getPrefetchMargin(self):
+		return self.prefetchMargin
+	def setPrefetchMargin(self, margin):
+		self.prefetchMargin = margin
+	def getFullByteBudget(self):
+		return self.fullByteBudget
+	def setFullByteBudget(self, budget):
+		self.fullByteBudget = budget
+	def getResidentBytes(self):
+		return self.fullBytes + sum(self.pixmapBytes(p) for p in self.thumbs.values())
 
-	def getImages(self):
-		return self.images			
+	# Number of images shown, i.e. the length of the order when there is one
 	def getImageCount(self):
-		return self.imageCount
+		if self.order is not None:
+			return len(self.order)
+		return self.store.getCount()
 	def deleteImage(self, filename, index):
 		try:
 		    os.remove('data/' + filename)
 		except OSError:
 		    pass		
-		del self.files[index]
-		del self.images[0][index]
-		del self.images[1][index]
-		self.imageCount -= 1
+		if self.order is not None:
+			del self.order[index]
+		self.forgetImage(filename)
+
+	# Remove an image from the library without touching its file
+	def forgetImage(self, filename):
+		if self.order is not None and filename in self.order:
+			self.order.remove(filename)
+		self.store.remove(self.store.getId(filename))
+		self.contentIndex.removeFile(filename)
+		self.releaseImage(filename)
+
+	# Remove many images at once, e.g. a folder deleted by another program.
+	# The order is filtered and the positions rebuilt once for the batch.
+	def forgetImages(self, filenames):
+		gone = set(filenames)
+		if self.order is not None:
+			self.order = [f for f in self.order if f not in gone]
+		self.store.removeBatch([self.store.getId(f) for f in gone])
+		self.contentIndex.removeFiles(gone)
+		for filename in gone:
+			self.releaseImage(filename)
+
+	# The file of an image changed: decode it and compute its features again
+	def reloadImage(self, filename):
+		self.releasePixmaps(filename)
+		self.features.remove(filename)
+
+	# Drop everything kept in memory for an image that left the library
+	def releaseImage(self, filename):
+		self.releasePixmaps(filename)
+		self.releaseSource(filename)
+		self.features.remove(filename)
+		self.staleThumbs.pop(filename, None)
+		self.staleFulls.pop(filename, None)
 
 
 ###################    End Model Class    ###################
\ No newline at end of file
@@ -0,0 +1,92 @@
+# File: Prefetcher.py
+# Usage: Used by View.py
+# System: OS X
+# Dependencies: Python3
+# Description: Warms the images the user is about to navigate to. Watches the
+#		direction and speed of key navigation and queues the next fullscreen
+#		renditions (or thumbnail pages) ahead of the selection. Prefetches
+#		that are still queued are cancelled when the direction reverses.
+#		While a key is held nothing is queued for the images passed; the
+#		images ahead are warmed once the selection settles.
+
+
+import time
+from collections import deque
+
+
+class Prefetcher:
+
+	# images warmed ahead when navigating slowly, and the most ever warmed
+	BASE_DEPTH = 2
+	MAX_DEPTH = 8
+	# thumbnail pages warmed ahead of the visible strip
+	BASE_PAGES = 1
+	MAX_PAGES = 3
+	# seconds of key presses used to estimate navigation speed
+	SPEED_WINDOW = 1.0
+
+	def __init__(self, model, pageSize):
+		self.model = model
+		self.pageSize = pageSize
+		self.direction = 0
+		self.presses = deque()
+		# (fileName, mode) requests queued by the last prefetch
+		self.queued = []
+
+	# Called after a navigation key changed the selection.
+	# step is the signed number of images moved, 0 to warm both sides.
+	def navigated(self, mode, step):
+		if self.model.getImageCount() == 0:
+			return
+		now = time.monotonic()
+		direction = (step > 0) - (step < 0)
+		if direction != self.direction:
+			self.cancel()
+			self.presses.clear()
+			self.direction = direction
+
+		self.presses.append(now)
+		while now - self.presses[0] > Prefetcher.SPEED_WINDOW:
+			self.presses.popleft()
+		# a held key passes images faster than they can be decoded
+		if self.model.isScrolling():
+			self.cancel()
+			return
+		self.warm(mode)
+
+	# Called once a held navigation key is released
+	def settled(self, mode):
+		if self.model.getImageCount() > 0 and mode in (0, 1):
+			self.warm(mode)
+
+	# Queue the images ahead of the selection in the current direction
+	def warm(self, mode):
+		direction = self.direction
+		# presses per second
+		speed = len(self.presses) / Prefetcher.SPEED_WINDOW
+
+		if mode == 1:
+			depth = min(Prefetcher.MAX_DEPTH, Prefetcher.BASE_DEPTH + int(speed / 2))
+			selected = self.model.getSelectedIndex()
+			if direction == 0:
+				indices = [selected + i for i in range(-depth, depth + 1) if i != 0]
+			else:
+				indices = [selected + direction * i for i in range(1, depth + 1)]
+		else:
+			pages = min(Prefetcher.MAX_PAGES, Prefetcher.BASE_PAGES + int(speed / 4))
+			leftmost = self.model.getLeftmostIndex()
+			if direction >= 0:
+				indices = list(range(leftmost + self.pageSize, leftmost + (pages + 1) * self.pageSize))
+			else:
+				indices = list(range(leftmost - pages * self.pageSize, leftmost))
+
+		self.queued = [q for q in self.queued if self.model.isDecoding(*q)]
+		self.queued.extend(self.model.prefetch(mode, indices))
+
+	# Drop prefetches that have not started decoding yet
+	def cancel(self):
+		self.model.cancelPrefetch(self.queued)
+		self.queued = []
+
+	def getDirection(self):
+		return self.direction
@@ -0,0 +1,102 @@
+# File: QueryCache.py
+# Usage: Used by FlickrSearch.py
+# System: OS X
+# Dependencies: Python3
+# Description: In-memory and on-disk cache of search query results with a
+#		time to live (None keeps them for good). Results are stored as JSON,
+#		one file per query, so that repeated searches (or smaller pages of one)
+#		return without a request.
+
+
+import os, json, time, hashlib
+from FileWriter import writeAtomic
+
+
+class QueryCache:
+
+	DIRECTORY = os.path.join('cache', 'queries')
+	TTL = 60 * 60
+
+	def __init__(self, directory = DIRECTORY, ttl = TTL):
+		self.directory = directory
+		self.ttl = ttl
+		# { (query, page): (timestamp, perPage, photos) }
+		self.entries = {}
+		os.makedirs(self.directory, exist_ok=True)
+		self.prune()
+
+	def makeKey(self, query, page):
+		return (' '.join(query.lower().split()), int(page))
+
+	def fileName(self, key):
+		digest = hashlib.sha1(('%s|%d' % key).encode('utf-8')).hexdigest()
+		return os.path.join(self.directory, digest + '.json')
+
+	# Returns up to perPage cached photos for a query or None. An entry fetched
+	# with a larger page size also answers smaller requests.
+	def get(self, query, perPage, page = 1):
+		key = self.makeKey(query, page)
+		entry = self.entries.get(key)
+		if entry is None:
+			entry = self.load(key)
+		if entry is None:
+			return None
+
+		timestamp, cachedPerPage, photos = entry
+		if self.ttl is not None and time.time() - timestamp > self.ttl:
+			self.remove(key)
+			return None
+		# a short result page means there were no more photos to fetch
+		if cachedPerPage < int(perPage) and len(photos) >= cachedPerPage:
+			return None
+		return photos[:int(perPage)]
+
+	def put(self, query, perPage, photos, page = 1):
+		key = self.makeKey(query, page)
+		entry = (time.time(), int(perPage), photos)
+		self.entries[key] = entry
+
+		data = {
+			'query': key[0], 'page': key[1], 'time': entry[0],
+			'perPage': entry[1], 'photos': photos
+		}
+		try:
+			writeAtomic(self.fileName(key), lambda f: json.dump(data, f), 'w')
+		except OSError as e:
+			print('Could not cache query: ', e)
+
+	def load(self, key):
+		try:
+			with open(self.fileName(key)) as f:
+				data = json.load(f)
+		except (OSError, ValueError):
+			return None
+		if data.get('query') != key[0] or data.get('page') != key[1]:
+			return None
+		entry = (data['time'], data['perPage'], data['photos'])
+		self.entries[key] = entry
+		return entry
+
+	def remove(self, key):
+		self.entries.pop(key, None)
+		try:
+			os.remove(self.fileName(key))
+		except OSError:
+			pass
+
+	# Delete expired entries from disk
+	def prune(self):
+		if self.ttl is None:
+			return
+		now = time.time()
+		with os.scandir(self.directory) as it:
+			for entry in it:
+				if entry.name.endswith('.json') and now - entry.stat().st_mtime > self.ttl:
+					try:
+						os.remove(entry.path)
+					except OSError:
+						pass
+
+	def clear(self):
+		for key in list(self.entries):
+			self.remove(key)
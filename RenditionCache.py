@@ -0,0 +1,152 @@
+# File: RenditionCache.py
+# Usage: Used by Model.py
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: Persistent on-disk cache of already scaled image renditions.
+#		Entries are keyed by source path and target (w, h, border) and stamped
+#		with the source size & mtime so that edited files are invalidated.
+#		The total size of the cache is bounded with least recently used eviction.
+
+
+import os, hashlib, threading
+from collections import OrderedDict
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+from FileWriter import writeAtomic
+
+
+class RenditionCache:
+
+	DIRECTORY = os.path.join('cache', 'renditions')
+	MAX_BYTES = 256 * 1024 * 1024
+	JPEG_QUALITY = 90
+
+	def __init__(self, directory = DIRECTORY, maxBytes = MAX_BYTES):
+		self.directory = directory
+		self.maxBytes = maxBytes
+		self.lock = threading.Lock()
+		# { slot: (stamp, fileName, byteSize) } ordered from least to most recently used
+		self.entries = OrderedDict()
+		self.totalBytes = 0
+		os.makedirs(self.directory, exist_ok=True)
+		self.scan()
+
+	# Index the existing cache files once, oldest use first
+	def scan(self):
+		found = []
+		with os.scandir(self.directory) as it:
+			for entry in it:
+				name, ext = os.path.splitext(entry.name)
+				if ext not in ('.png', '.jpg') or name.count('-') != 1:
+					continue
+				st = entry.stat()
+				slot, stamp = name.split('-')
+				found.append((st.st_mtime, slot, stamp, entry.name, st.st_size))
+
+		for _, slot, stamp, fileName, size in sorted(found):
+			if slot in self.entries:
+				self.removeEntry(slot)
+			self.entries[slot] = (stamp, fileName, size)
+			self.totalBytes += size
+		self.evict()
+
+	# Slot identifies the rendition, stamp identifies the version of the source
+	def makeKey(self, path, w, h, b):
+		st = os.stat(path)
+		slot = '%s|%d|%d|%d' % (os.path.abspath(path), w, h, b)
+		stamp = '%d|%d' % (st.st_size, st.st_mtime_ns)
+		return (
+			hashlib.sha1(slot.encode('utf-8')).hexdigest()[:24],
+			hashlib.sha1(stamp.encode('utf-8')).hexdigest()[:12]
+		)
+
+	# Returns the cached QImage or None. Stale entries are removed.
+	def get(self, path, w, h, b):
+		try:
+			slot, stamp = self.makeKey(path, w, h, b)
+		except OSError:
+			return None
+
+		with self.lock:
+			entry = self.entries.get(slot)
+			if entry is None:
+				return None
+			if entry[0] != stamp:
+				self.removeEntry(slot)
+				return None
+			self.entries.move_to_end(slot)
+			fileName = os.path.join(self.directory, entry[1])
+
+		image = QImage(fileName)
+		if image.isNull():
+			with self.lock:
+				self.removeEntry(slot)
+			return None
+		try:
+			os.utime(fileName)
+		except OSError:
+			pass
+		return image
+
+	# Stores a rendition of the source file at path. Writes are atomic.
+	def put(self, path, w, h, b, image):
+		if image is None or image.isNull():
+			return
+		try:
+			slot, stamp = self.makeKey(path, w, h, b)
+		except OSError:
+			return
+
+		if image.hasAlphaChannel():
+			ext, fmt, quality = '.png', 'PNG', -1
+		else:
+			ext, fmt, quality = '.jpg', 'JPG', RenditionCache.JPEG_QUALITY
+		fileName = slot + '-' + stamp + ext
+		fullName = os.path.join(self.directory, fileName)
+		data = QByteArray()
+		buffer = QBuffer(data)
+		buffer.open(QIODevice.WriteOnly)
+		if not image.save(buffer, fmt, quality):
+			return
+		try:
+			writeAtomic(fullName, lambda f: f.write(bytes(data)))
+			size = data.size()
+		except OSError:
+			return
+
+		with self.lock:
+			if slot in self.entries:
+				if self.entries[slot][1] == fileName:
+					self.totalBytes -= self.entries.pop(slot)[2]
+				else:
+					self.removeEntry(slot)
+			self.entries[slot] = (stamp, fileName, size)
+			self.totalBytes += size
+			self.evict()
+
+	# Drop least recently used entries until the cache fits in maxBytes
+	def evict(self):
+		while self.totalBytes > self.maxBytes and len(self.entries) > 0:
+			self.removeEntry(next(iter(self.entries)))
+
+	def removeEntry(self, slot):
+		stamp, fileName, size = self.entries.pop(slot)
+		self.totalBytes -= size
+		try:
+			os.remove(os.path.join(self.directory, fileName))
+		except OSError:
+			pass
+
+	def clear(self):
+		with self.lock:
+			for slot in list(self.entries):
+				self.removeEntry(slot)
+
+	def getTotalBytes(self):
+		return self.totalBytes
+	def getMaxBytes(self):
+		return self.maxBytes
+	def setMaxBytes(self, maxBytes):
+		with self.lock:
+			self.maxBytes = maxBytes
+			self.evict()
@@ -0,0 +1,84 @@
+# File: SoundBank.py
+# Usage: Used by View.py
+# System: OS X
+# Dependencies: Python3, PyQt5 (QtMultimedia)
+# Description: Navigation sound effects loaded once and replayed from a small
+#		pool of players per sound, so a key press only starts a player that is
+#		already loaded. Up to maxVoices copies of a sound may overlap, after
+#		which the oldest one is restarted. QtMultimedia is imported on first
+#		use; when it is missing or audio is disabled, play() does nothing.
+
+
+import os
+from PyQt5.QtCore import QObject, QUrl
+
+
+class SoundBank(QObject):
+
+	DIRECTORY = 'audio'
+	# index is the sound type: 0=short, 1=medium, 2=long
+	FILES = ['short.wav', 'medium.wav', 'long.wav']
+	MAX_VOICES = 3
+
+	def __init__(self, parent = None, enabled = True, maxVoices = MAX_VOICES, directory = DIRECTORY):
+		super().__init__(parent)
+		self.enabled = enabled
+		self.maxVoices = max(1, maxVoices)
+		self.directory = directory
+		# { soundType: [QSoundEffect, ...] } in the order they were last started
+		self.players = {}
+		self.effectClass = None
+
+	# Create one player per sound ahead of the first key press
+	def preload(self):
+		for soundType in range(len(SoundBank.FILES)):
+			if not self.enabled or soundType in self.players:
+				continue
+			player = self.createPlayer(soundType)
+			if player is None:
+				return
+			self.players[soundType] = [player]
+
+	def play(self, soundType = 0):
+		if not self.enabled:
+			return
+		players = self.players.setdefault(soundType, [])
+		for i, player in enumerate(players):
+			if not player.isPlaying():
+				break
+		else:
+			if len(players) < self.maxVoices:
+				player = self.createPlayer(soundType)
+				if player is None:
+					return
+				i = len(players)
+				players.append(player)
+			else:
+				# every voice is busy, restart the one started longest ago
+				i, player = 0, players[0]
+				player.stop()
+		players.append(players.pop(i))
+		player.play()
+
+	def createPlayer(self, soundType):
+		if self.effectClass is None:
+			try:
+				from PyQt5.QtMultimedia import QSoundEffect
+			except ImportError as e:
+				print('Audio disabled: ', e)
+				self.enabled = False
+				return None
+			self.effectClass = QSoundEffect
+		player = self.effectClass(self)
+		player.setSource(QUrl.fromLocalFile(os.path.abspath(os.path.join(self.directory, SoundBank.FILES[soundType]))))
+		player.setLoopCount(1)
+		return player
+
+	def setMaxVoices(self, maxVoices):
+		self.maxVoices = max(1, maxVoices)
+
+	def getMaxVoices(self):
+		return self.maxVoices
+
+	def isEnabled(self):
+		return self.enabled
@@ -0,0 +1,141 @@
+# File: Stats.py
+# Usage: python3 ImageBrowser.py --stats [trace.json]
+# System: OS X
+# Dependencies: Python3
+# Description: Timing and counter hooks for the expensive code paths. Disabled
+#		by default, in which case a hook costs one attribute check. When enabled
+#		it keeps per-name durations for live p50/p99 stats and records trace
+#		events that can be dumped as JSON and opened in a trace viewer
+#		(chrome://tracing or Perfetto).
+
+
+import os, json, time, threading, functools
+
+
+class Stats:
+
+	# trace events kept in memory, older ones are dropped
+	MAX_EVENTS = 200000
+	# durations kept per name for percentiles
+	MAX_SAMPLES = 1000
+
+	def __init__(self):
+		self.enabled = False
+		self.lock = threading.Lock()
+		self.origin = time.perf_counter()
+		self.samples = {}
+		self.counters = {}
+		self.events = []
+
+	def enable(self):
+		self.enabled = True
+		self.origin = time.perf_counter()
+
+	# Decorator timing every call of a function under name
+	def timed(self, name):
+		def decorator(function):
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				if not self.enabled:
+					return function(*args, **kwargs)
+				start = time.perf_counter()
+				try:
+					return function(*args, **kwargs)
+				finally:
+					self.record(name, start, time.perf_counter())
+			return wrapper
+		return decorator
+
+	# Context manager timing a block under name
+	def timer(self, name):
+		if not self.enabled:
+			return NULL_TIMER
+		return Timer(self, name)
+
+	def record(self, name, start, end):
+		if not self.enabled:
+			return
+		with self.lock:
+			samples = self.samples.setdefault(name, [])
+			samples.append(end - start)
+			if len(samples) > Stats.MAX_SAMPLES:
+				del samples[:len(samples) - Stats.MAX_SAMPLES]
+			if len(self.events) < Stats.MAX_EVENTS:
+				self.events.append((name, start, end, threading.get_ident()))
+
+	def count(self, name, amount = 1):
+		if self.enabled:
+			with self.lock:
+				self.counters[name] = self.counters.get(name, 0) + amount
+
+	def getCount(self, name):
+		return self.counters.get(name, 0)
+
+	# Duration in seconds at percentile p (0-1) of the recent calls of name
+	def percentile(self, name, p):
+		with self.lock:
+			samples = sorted(self.samples.get(name, ()))
+		if len(samples) == 0:
+			return 0.0
+		return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+	def summary(self):
+		with self.lock:
+			names = list(self.samples)
+		return {
+			'timings': {
+				name: {
+					'calls': len(self.samples[name]),
+					'p50_ms': self.percentile(name, 0.5) * 1000,
+					'p99_ms': self.percentile(name, 0.99) * 1000
+				} for name in names
+			},
+			'counters': dict(self.counters)
+		}
+
+	# Write the trace event format: complete ('X') events in microseconds
+	def dump(self, path):
+		if not self.enabled:
+			return
+		pid = os.getpid()
+		with self.lock:
+			events = [{
+				'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+				'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6
+			} for name, start, end, tid in self.events]
+		events.extend({
+			'name': name, 'ph': 'C', 'pid': pid, 'ts': (time.perf_counter() - self.origin) * 1e6,
+			'args': {name: value}
+		} for name, value in self.counters.items())
+		with open(path, 'w') as f:
+			json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'summary': self.summary()}, f)
+		print('Stats written to', path)
+
+
+class Timer:
+
+	def __init__(self, stats, name):
+		self.stats, self.name = stats, name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.stats.record(self.name, self.start, time.perf_counter())
+		return False
+
+
+class NullTimer:
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+
+NULL_TIMER = NullTimer()
+
+# shared by every module
+stats = Stats()
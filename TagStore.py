@@ -0,0 +1,253 @@
+# File: TagStore.py
+# Usage: Used by View.py
+# System: OS X
+# Dependencies: Python3
+# Description: Index of the tags of every image, loaded once from the tags
+#		folder and updated in place. Tags are stored one per line in a file
+#		named after the image with .txt appended (e.g. tags/Test0.png.txt),
+#		images in subfolders of data have their tag files in the same
+#		subfolders of tags.
+#		Only images whose tags changed since the last save are written.
+#		An inverted index (tag -> images) answers AND/OR/NOT tag queries.
+
+
+import os, re
+from FileWriter import writeAtomic
+
+
+class TagStore:
+
+	DIRECTORY = 'tags'
+	# quoted tags, parentheses, or words separated by whitespace
+	QUERY_TOKENS = re.compile(r'"([^"]*)"|(\()|(\))|([^\s()"]+)')
+
+	def __init__(self, directory = DIRECTORY):
+		self.directory = directory
+		# { imgFileName: [tag1, tag2, ...] }
+		self.tags = {}
+		# images with tags changed since the last save
+		self.dirty = set()
+		# { lowercase tag: set(imgFileName) }
+		self.index = {}
+		# image names that had a tag file when the tags folder was scanned
+		self.tagFiles = set()
+
+	# Read the tag files of the given images after a single pass over the tags folder
+	def load(self, fileNames):
+		self.tags = {}
+		self.dirty = set()
+		self.index = {}
+		self.tagFiles = set()
+		self.scanTagFiles('')
+		self.loadImages(fileNames)
+
+	def scanTagFiles(self, subdirectory):
+		try:
+			it = os.scandir(os.path.join(self.directory, subdirectory))
+		except OSError:
+			return
+		with it:
+			for entry in it:
+				if entry.name.endswith('.txt'):
+					self.tagFiles.add(subdirectory + entry.name[:-len('.txt')])
+				elif entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+					self.scanTagFiles(subdirectory + entry.name + '/')
+
+	# Register images found after load(), reading the tag files they have
+	def loadImages(self, fileNames):
+		for name in fileNames:
+			if name in self.tags:
+				continue
+			self.tags[name] = []
+			if name in self.tagFiles:
+				try:
+					self.tags[name] = self.readTagFile(self.getTagFileName(name))
+				except OSError:
+					continue
+				self.indexTags(name, self.tags[name])
+
+	def readTagFile(self, path):
+		with open(path, 'r') as file:
+			return [x.strip() for x in file.readlines()]
+
+	def indexTags(self, fileName, taglist):
+		for tag in taglist:
+			self.index.setdefault(tag.lower(), set()).add(fileName)
+
+	def unindexTags(self, fileName, taglist):
+		for tag in taglist:
+			key = tag.lower()
+			names = self.index.get(key)
+			if names is not None:
+				names.discard(fileName)
+				if len(names) == 0:
+					del self.index[key]
+
+	def getTagFileName(self, fileName):
+		return os.path.join(self.directory, fileName + '.txt')
+
+	# Register images without touching the tags of ones already known
+	def addImages(self, fileNames):
+		for name in fileNames:
+			self.tags.setdefault(name, [])
+
+	# Forget an image and delete its tag file unless deleteFile is False
+	def removeImage(self, fileName, deleteFile = True):
+		taglist = self.tags.pop(fileName, None)
+		self.dirty.discard(fileName)
+		if taglist:
+			self.unindexTags(fileName, taglist)
+			if not deleteFile:
+				return
+			try:
+				os.remove(self.getTagFileName(fileName))
+			except OSError:
+				pass
+
+	# Read the tag files of the given images again, e.g. after another program
+	# changed them. Images with unsaved tags keep them. Returns the images updated.
+	def reloadImages(self, fileNames):
+		updated = []
+		for fileName in fileNames:
+			if fileName not in self.tags or fileName in self.dirty:
+				continue
+			try:
+				taglist = self.readTagFile(self.getTagFileName(fileName))
+			except OSError:
+				taglist = []
+			if taglist != self.tags[fileName]:
+				self.unindexTags(fileName, self.tags[fileName])
+				self.tags[fileName] = taglist
+				self.indexTags(fileName, taglist)
+				updated.append(fileName)
+		return updated
+
+	def addTag(self, fileName, tag):
+		self.tags.setdefault(fileName, []).append(tag)
+		self.index.setdefault(tag.lower(), set()).add(fileName)
+		self.dirty.add(fileName)
+
+	# Write the tag files of changed images. Each file is written to a temporary
+	# name and renamed into place. Returns the number of files written.
+	def save(self):
+		written = 0
+		for fileName in list(self.dirty):
+			taglist = self.tags.get(fileName, [])
+			path = self.getTagFileName(fileName)
+			try:
+				if len(taglist) > 0:
+					os.makedirs(os.path.dirname(path), exist_ok=True)
+					text = '\n'.join(tag.strip('\n') for tag in taglist)
+					writeAtomic(path, lambda file: file.write(text), 'w')
+				elif os.path.exists(path):
+					os.remove(path)
+			except OSError as e:
+				print('Could not save tags for ', fileName, ': ', e)
+				continue
+			self.dirty.discard(fileName)
+			written += 1
+		return written
+
+	def isDirty(self, fileName = None):
+		if fileName is None:
+			return len(self.dirty) > 0
+		return fileName in self.dirty
+
+	# Images matching a tag query such as: sunset AND (beach OR "golden gate") NOT night
+	# Adjacent terms are ANDed, tags are case-insensitive and multi word tags are
+	# quoted. Answered from the inverted index in time proportional to the sets
+	# involved, except for a query made only of NOTs. Raises ValueError on bad syntax.
+	def query(self, text):
+		tokens = []
+		for quoted, lparen, rparen, word in TagStore.QUERY_TOKENS.findall(text):
+			if lparen or rparen:
+				tokens.append(lparen or rparen)
+			elif quoted:
+				tokens.append(('tag', quoted.lower()))
+			elif word.upper() in ('AND', 'OR', 'NOT'):
+				tokens.append(word.upper())
+			else:
+				tokens.append(('tag', word.lower()))
+		if len(tokens) == 0:
+			raise ValueError('Empty query')
+
+		self.tokens, self.pos = tokens, 0
+		include, exclude = self.parseOr()
+		if self.pos != len(self.tokens):
+			raise ValueError('Unexpected ' + str(self.tokens[self.pos]))
+		return self.resolve(include, exclude)
+
+	# Sub-queries evaluate to (include, exclude): the images in include (every image
+	# when include is None) that are not in exclude. This keeps NOT a set difference.
+	def parseOr(self):
+		include, exclude = self.parseAnd()
+		while self.peek() == 'OR':
+			self.pos += 1
+			other = self.resolve(*self.parseAnd())
+			include = self.resolve(include, exclude) | other
+			exclude = set()
+		return include, exclude
+
+	def parseAnd(self):
+		positives, exclude = [], set()
+		while True:
+			negate = False
+			while self.peek() == 'NOT':
+				self.pos += 1
+				negate = not negate
+			include, excl = self.parseTerm()
+			if negate:
+				exclude |= self.resolve(include, excl)
+			elif include is None:
+				exclude |= excl
+			else:
+				positives.append(self.resolve(include, excl))
+
+			if self.peek() == 'AND':
+				self.pos += 1
+			elif self.peek() in (None, 'OR', ')'):
+				break
+
+		if len(positives) == 0:
+			return None, exclude
+		positives.sort(key=len)
+		include = set(positives[0])
+		for names in positives[1:]:
+			include &= names
+		return include, exclude
+
+	def parseTerm(self):
+		token = self.peek()
+		if token == '(':
+			self.pos += 1
+			result = self.parseOr()
+			if self.peek() != ')':
+				raise ValueError('Missing )')
+			self.pos += 1
+			return result
+		if isinstance(token, tuple):
+			self.pos += 1
+			return set(self.index.get(token[1], ())), set()
+		if token is None:
+			raise ValueError('Unexpected end of query')
+		raise ValueError('Unexpected ' + str(token))
+
+	def peek(self):
+		return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+	def resolve(self, include, exclude):
+		if include is None:
+			return {name for name in self.tags if name not in exclude}
+		return include - exclude
+
+	def getTagNames(self):
+		return self.index.keys()
+
+	def getTags(self, fileName):
+		return self.tags.get(fileName, [])
+
+	def hasImage(self, fileName):
+		return fileName in self.tags
+
+	def items(self):
+		return self.tags.items()
@@ -8,10 +8,9 @@
 #		Also, displays images, handles user events, tag actions, etc.. 
 # Test Search: SFSUCS413F16Test
 
-import Model, os, sys, json, requests, time
+import Model, Prefetcher, GridView, FlickrSearch, FileWriter, TagStore, SoundBank, LibraryScanner, LibraryWatcher, Stats, os, sys, json, time, itertools
 from PyQt5.QtWidgets import QWidget, QLabel, QPushButton, QAction, QLineEdit
 from PyQt5.QtCore import *
-from PyQt5.QtMultimedia import QSoundEffect
 
 class View(QWidget):
 
@@ -22,21 +21,84 @@ class View(QWidget):
 	BTNS 	= '#D3D3D3'	
 
 	WINDOW_TITLE = 'Image Browser'
+	DATA_DIR = 'data'
+	# files taken before the window is first drawn, the rest are added in
+	# chunks of DISCOVERY_CHUNK while the browser can already be used
+	FIRST_FILES = 50
+	DISCOVERY_CHUNK = 500
 	THUMB_QTY = 5
 	MAX_RESULTS = 20
+	# delay before changed tags are saved automatically, 0 to only save on request
+	AUTOSAVE_TAGS_MS = 0
+	# False skips the audio backend entirely (headless & benchmark runs)
+	AUDIO = True
+	# how many copies of one sound may play over each other
+	MAX_SOUND_VOICES = 3
+	# quiet time after the last resize event before images are decoded at the new size
+	RESIZE_SETTLE_MS = 150
+	# at most one redraw per display frame; key events only update the Model
+	FRAME_MS = 16
+	# quiet time after the last auto-repeated key before images are decoded
+	SCROLL_SETTLE_MS = 150
+	# shortest gap between two sounds while a key is held down
+	REPEAT_SOUND_MS = 100
 	FLICKR_URL = 'https://api.flickr.com/services/rest/?method=flickr.photos.search&format=json&nojsoncallback=1&sort=relevance'
+	PHOTO_URL = 'https://farm{farm}.staticflickr.com/{server}/{id}_{secret}.jpg'
 
 
 	def __init__(self, windowWidth, files, safeMode, apiKeyExists):
 		super().__init__()
 
 		self.model = Model.Model(self)
-		self.model.initModel(windowWidth, files, View.THUMB_QTY)
+		# files is a list or a generator such as LibraryScanner.scan()
+		self.discovery = iter(files)
+		self.model.initModel(windowWidth, list(itertools.islice(self.discovery, View.FIRST_FILES)), View.THUMB_QTY)
 
 		self.labels = self.model.generateLabels(self, View.THUMB_QTY + 1)
+		# cacheKey of the pixmap shown by each label, to skip unchanged labels
+		self.labelPixmaps = [None] * len(self.labels)
+		self.drawnMode = None
+		# mode that leaving full screen returns to, the strip or the grid
+		self.returnMode = 0
+		for label in self.labels:
+			label.setAlignment(Qt.AlignCenter)
+			label.clicked.connect(self.mouseSel)
+		self.styleLabels()
+		self.prefetcher = Prefetcher.Prefetcher(self.model, View.THUMB_QTY)
 		self.apiKey = self.model.getApiKey() if apiKeyExists else ''
+		self.flickr = FlickrSearch.FlickrSearch(View.FLICKR_URL, self.apiKey, self)
+		self.flickr.finished.connect(self.handleSearchResults)
+		self.flickr.failed.connect(self.handleSearchFailed)
+		self.model.downloader.downloaded.connect(self.handleImageDownloaded)
+		self.model.downloader.progress.connect(self.handleDownloadProgress)
+		self.model.downloader.finished.connect(self.handleDownloadFinished)
+		self.model.indexProgress.connect(self.handleIndexProgress)
+		self.writer = FileWriter.FileWriter(self)
+		self.writer.written.connect(self.handleImageSaved)
+		self.writer.progress.connect(self.handleSaveProgress)
+		self.writer.finished.connect(self.handleSaveFinished)
+		self.saving = {}
+		self.tagStore = TagStore.TagStore()
+		self.autosaveTimer = QTimer(self)
+		self.autosaveTimer.setSingleShot(True)
+		self.autosaveTimer.timeout.connect(self.saveTags)
+		self.sounds = SoundBank.SoundBank(self, View.AUDIO, View.MAX_SOUND_VOICES)
+		self.resizeTimer = QTimer(self)
+		self.resizeTimer.setSingleShot(True)
+		self.resizeTimer.timeout.connect(self.resizeSettled)
+		self.frameTimer = QTimer(self)
+		self.frameTimer.setSingleShot(True)
+		self.frameTimer.timeout.connect(self.draw)
+		self.scrollTimer = QTimer(self)
+		self.scrollTimer.setSingleShot(True)
+		self.scrollTimer.timeout.connect(self.scrollSettled)
+		self.lastSound = 0
+		self.watcher = LibraryWatcher.LibraryWatcher([View.DATA_DIR, self.tagStore.directory], self)
+		self.watcher.changed.connect(self.handleLibraryChanged)
+		self.scanner = LibraryScanner.LibraryScanner(View.DATA_DIR)
 		self.safeMode, self.confirmedExit, self.confirmedDelete, self.audioOn = safeMode, False, False, True
 		self.thumbModeComponents,self.fullModeComponents,self.windowComponents,self.statusText = [],[],[],None
+		self.gridModeComponents = []
 
 		self.initUI()
 
@@ -50,113 +112,201 @@ class View(QWidget):
 		self.draw() 
 		self.show()
 		self.setFocus()
+		# load the sound effects once the window is up instead of on the first key press
+		QTimer.singleShot(0, self.sounds.preload)
+		QTimer.singleShot(0, self.watcher.start)
+		QTimer.singleShot(0, self.discoverFiles)
 		self.loadStyles()
 
-	# Attach images to labels in thumbnail or fullscreen mode
+	# Attach images to labels in thumbnail or fullscreen mode.
+	# Only labels whose image, selection or position changed are touched,
+	# so the cost of a draw does not grow with the length of the session.
+	@Stats.stats.timed('View.draw')
 	def draw(self):	
+		self.frameTimer.stop()
 		self.clearBrowser()
 		mode = self.model.getMode()
 		leftmost = self.model.getLeftmostIndex()
 		selected = self.model.getSelectedIndex()
+		shown = 0
 		
 		if self.model.getImageCount() > 0:
 			# Thumbnail Mode
 			if mode == 0:
-				if self.model.getImageCount() > 0:	
-					y = self.model.getWindowHeight() / 3
-					visibleThumbQty = View.THUMB_QTY if self.model.getImageCount() > View.THUMB_QTY-1 else self.model.getImageCount()
-					for i in range(visibleThumbQty):
-						x = int(
-							((self.model.getWindowWidth() - self.model.getThumbWidth()*View.THUMB_QTY)/2) + i*self.model.getThumbWidth()
-						)
-						# Center the highlighted thumbnail when returning from full screen mode
-						thumb = (leftmost + i) % self.model.getImageCount()				
-						color = View.THUMB
-						if thumb == selected:
-							color = View.SEL	
-						
-						self.attachPixmap(
-							thumb, i, x, y, self.model.getThumbWidth(), self.model.getThumbHeight(), self.model.getThumbBorder(), color
-						)
-				self.showThumbModeComponents()
+				y = self.model.getWindowHeight() // 3
+				visibleThumbQty = View.THUMB_QTY if self.model.getImageCount() > View.THUMB_QTY-1 else self.model.getImageCount()
+				self.model.setVisibleRange(leftmost, visibleThumbQty)
+				for i in range(visibleThumbQty):
+					x = int(
+						((self.model.getWindowWidth() - self.model.getThumbWidth()*View.THUMB_QTY)/2) + i*self.model.getThumbWidth()
+					)
+					# Center the highlighted thumbnail when returning from full screen mode
+					thumb = (leftmost + i) % self.model.getImageCount()				
+					self.attachPixmap(
+						thumb, i, x, y, self.model.getThumbWidth(), self.model.getThumbHeight(), thumb == selected
+					)
+				shown = visibleThumbQty
 
 			# Full Screen Mode		
 			elif mode == 1:
-				if self.model.getImageCount() > 0:
-					x = (self.model.getWindowWidth() - self.model.getFullWidth()) / 2
-					y = (self.model.getWindowHeight() - self.model.getFullHeight()) / 2
-					self.attachPixmap(
-						selected, View.THUMB_QTY, x, y, self.model.getFullWidth(), 
-						self.model.getFullHeight(), self.model.getFullBorder(), View.SEL
-					)
-				self.showFullModeComponents()
-				self.showTags()
-		else:
-			if mode == 0:
-				self.showThumbModeComponents()
-			else:
-				self.showFullModeComponents()
-				self.showTags()
+				x = (self.model.getWindowWidth() - self.model.getFullWidth()) // 2
+				y = (self.model.getWindowHeight() - self.model.getFullHeight()) // 2
+				self.attachPixmap(
+					selected, View.THUMB_QTY, x, y, self.model.getFullWidth(), self.model.getFullHeight(), True
+				)
+
+		# hide labels left over from a longer strip or from the other mode
+		for i, label in enumerate(self.labels):
+			visible = (i < shown) if i < View.THUMB_QTY else (mode == 1 and self.model.getImageCount() > 0)
+			if not visible and not label.isHidden():
+				label.hide()
+
+		if mode == 1:
+			self.showTags()
+		# Grid Mode
+		elif mode == 2:
+			self.grid.sync()
+
+	# Lay the browser out for the new window size right away, showing the current
+	# images scaled. They are decoded again at the new size once resizing stops.
+	def resizeEvent(self, event):
+		width, height = event.size().width(), event.size().height()
+		if (width, height) == (self.model.getWindowWidth(), self.model.getWindowHeight()):
+			return
+		self.model.setResizing(True)
+		if self.model.resizeWindow(width, height):
+			self.styleLabels()
+		self.layoutWindowComponents()
+		self.layoutThumbModeComponents()
+		self.layoutFullModeComponents()
+		self.layoutGridModeComponents()
+		self.draw()
+		self.resizeTimer.start(View.RESIZE_SETTLE_MS)
+
+	def resizeSettled(self):
+		self.model.setResizing(False)
+		self.draw()
+
+	# Redraw with the next frame, however many times this is called before it
+	def scheduleDraw(self):
+		if not self.frameTimer.isActive():
+			self.frameTimer.start(View.FRAME_MS)
+
+	# The key was released (or held long enough): decode what is on screen
+	def scrollSettled(self):
+		self.model.setScrolling(False)
+		self.draw()
+		self.prefetcher.settled(self.model.getMode())
+
+	# Border width & colors are set once per label; selection only flips the
+	# 'selected' property, which re-polishes just that label
+	def styleLabels(self):
+		thumbStyle = (
+			'QLabel { border: ' + str(self.model.getThumbBorder()) + 'px solid ' + View.THUMB + '; } '
+			+ 'QLabel[selected="true"] { border-color: ' + View.SEL + '; }'
+		)
+		for label in self.labels[:View.THUMB_QTY]:
+			label.setStyleSheet(thumbStyle)
+		self.labels[View.THUMB_QTY].setStyleSheet(
+			'QLabel { border: ' + str(self.model.getFullBorder()) + 'px solid ' + View.SEL + '; }'
+		)
 
 	# Assigns an image to one of the labels
-	def attachPixmap(self, pindex, lindex, x, y, w, h, b, color):
+	def attachPixmap(self, pindex, lindex, x, y, w, h, selected):
 		mode = 0
 		if lindex == View.THUMB_QTY:
 			mode = 1
 
-		self.labels[lindex].setPixIndex(pindex)
-		self.labels[lindex].setPixmap(self.model.getPixmap(mode, pindex))
-		self.labels[lindex].setAlignment(Qt.AlignCenter)
-		self.labels[lindex].setGeometry(QRect(x, y, w, h))
-		self.labels[lindex].setStyleSheet('border: ' + str(b) + 'px solid '+ color + ';')
-		self.labels[lindex].clicked.connect(self.mouseSel)
-		self.labels[lindex].show()
+		label = self.labels[lindex]
+		label.setPixIndex(pindex)
+		pixmap = self.model.getPixmap(mode, pindex)
+		if self.labelPixmaps[lindex] != pixmap.cacheKey():
+			label.setPixmap(pixmap)
+			self.labelPixmaps[lindex] = pixmap.cacheKey()
+		if label.property('selected') != selected:
+			label.setProperty('selected', selected)
+			label.style().unpolish(label)
+			label.style().polish(label)
+		rect = QRect(x, y, w, h)
+		if label.geometry() != rect:
+			label.setGeometry(rect)
+		if label.isHidden():
+			label.show()
+
+	# Redraw when a decoded image belongs to one of the visible labels
+	def imageDecoded(self, fileName, mode):
+		if self.model.getMode() == 2:
+			if mode == 0:
+				self.grid.imageDecoded(fileName)
+			return
+		for i, label in enumerate(self.labels):
+			if not label.isHidden() and (i == View.THUMB_QTY) == (mode == 1):
+				if self.model.getFile(label.getPixIndex()) == fileName:
+					self.scheduleDraw()
+					return
 
 	# Test API by searching for a single image using query in search text field
-	# https://farm{farm-id}.staticflickr.com/{server-id}/{id}_{secret}.jpg
 	def test(self):
+		self.clearFilter()
 		query = self.searchTextBox.text()
-		query = query.replace(' ', '%20')
-		url = self.FLICKR_URL + '&per_page=1&api_key='+self.apiKey + '&text='+query
-		response = requests.get(url).json()
-		if response['stat'] == 'ok' and response['photos']['total'] != '0':
-			pj = response['photos']['photo'][0]
-			photoUrl = 'https://farm' + str(pj['farm']) + '.staticflickr.com/' + str(pj['server'])
-			photoUrl = photoUrl + '/' + str(pj['id']) + '_' + str(pj['secret']) + '.jpg'
-			fileNames = self.model.requestImages([photoUrl])
-			self.addToTagDict(fileNames)
-			self.model.addFiles(fileNames, [photoUrl])
-			self.statusText.setText('Results found for "'+query.replace('%20', ' ')+ '". Fetching...')				
-		else:
-			self.statusText.setText('No results found.')
+		self.flickr.search(query, 1)
+		if self.flickr.isSearching():
+			self.statusText.setText('Searching for "'+query+'"...')
 
 	# Save any new images found from the web to data folder.
 	# Also save any new tags associated with new images.
+	# Images are written in the background from the bytes already downloaded.
+	@pyqtSlot()
+	@Stats.stats.timed('View.saveAll')
 	def saveAll(self):
 		if self.model.getImageCount() != 0:
 			newFiles = self.model.getNewFiles()
+			pending = 0
 			for file, url in newFiles.items():
-				with open('data/' + file, 'wb') as handle:
-					response = requests.get(url, stream=True)
-
-					if not response.ok:
-						print(response)
-
-					for block in response.iter_content(1024):
-						if not block:
-							break
-						handle.write(block)
-
-			# files are no longer new, so update the Model
-			self.model.clearNewFiles()
+				if file in self.saving:
+					continue
+				# images still downloading stay new until a later Save
+				source = self.model.getSource(file)
+				if source is None:
+					pending += 1
+					continue
+				self.saving[file] = url
+				self.model.clearNewFile(file)
+				self.writer.write('data/' + file, source, file)
 
 			self.saveTags()
-			self.statusText.setText(str(len(newFiles)) + ' new images saved.')
+			if self.writer.isBusy():
+				self.statusText.setText('Saving ' + str(len(self.saving)) + ' new images...')
+			elif pending > 0:
+				self.statusText.setText(str(pending) + ' new images are still downloading. Save again once they arrive.')
+			else:
+				self.statusText.setText('0 new images saved.')
 		else:
 			self.statusText.setText('There are no images to be saved.')
+
+	# The image is in data/ now, so the downloaded copy is no longer needed.
+	# Failed images are new again so the next Save retries them.
+	def handleImageSaved(self, file, ok):
+		url = self.saving.pop(file, None)
+		if not ok:
+			if url is not None:
+				self.model.addNewFile(file, url)
+		elif self.model.hasFile(file):
+			self.model.releaseSource(file)
+
+	def handleSaveProgress(self, done, total):
+		self.statusText.setText('Saving new images... (' + str(done) + ' of ' + str(total) + ')')
+
+	def handleSaveFinished(self, saved, failed):
+		text = str(saved) + ' new images saved.'
+		if failed > 0:
+			text += ' ' + str(failed) + ' could not be saved.'
+		self.statusText.setText(text)
 		
 	# Exit program in safe mode with confirmation else without
 	def exit(self):
+		if View.AUTOSAVE_TAGS_MS > 0:
+			self.saveTags()
 		if self.safeMode:
 			if self.confirmedExit:
 				sys.exit()
@@ -187,123 +337,292 @@ class View(QWidget):
 	def deleteNow(self):
 		index = self.model.getSelectedIndex()
 		filename = self.model.getFile(index)
+		# a save still queued would bring the file back
+		if filename in self.saving:
+			del self.saving[filename]
+			self.writer.cancel(filename)
 		self.model.deleteImage(filename, index)
 		self.model.setSelectedIndex(index)
-		if len(self.tagDict[filename]) > 0:
-			os.remove('tags/' + filename + '.txt')
-			self.tagDict.pop(filename, None)
+		self.tagStore.removeImage(filename)
 
 		self.draw()
 		self.statusText.setText('Image "'+filename+'" deleted.')
 
-	# Search for a specified amount of images (at the maximum) and display in browser
+	# Search for a specified amount of images (at the maximum) and display in browser.
+	# The request runs in the background and a newer search cancels it.
 	def search(self):
+		self.clearFilter()
 		query = self.searchTextBox.text()
-		query = query.replace(' ', '%20')
 		maxResults = self.maxResultBox.text() if len(self.maxResultBox.text()) > 0 else '1'
 		if self.safeMode:
 			maxResults = maxResults if int(maxResults) < View.MAX_RESULTS else View.MAX_RESULTS		
 		
-		url = self.FLICKR_URL + '&per_page='+str(maxResults) + '&api_key='+self.apiKey + '&text='+str(query)
-		response = requests.get(url).json()
-		if (response['stat'] == 'ok'):
-			photoUrls = []
-			for p in response['photos']['photo']:
-				photoUrl = 'https://farm' + str(p['farm']) + '.staticflickr.com/' + str(p['server'])
-				photoUrl = photoUrl + '/' + str(p['id']) + '_' + str(p['secret']) + '.jpg'
-				photoUrls.append(photoUrl)
-				print(photoUrl)
-			fileNames = self.model.requestImages(photoUrls)
-			self.addToTagDict(fileNames)
-			self.model.addFiles(fileNames, photoUrls)	
-			self.statusText.setText('Results found for "'+query.replace('%20', ' ')+ '". Fetching...')			
+		self.flickr.search(query, maxResults)
+		if self.flickr.isSearching():
+			self.statusText.setText('Searching for "'+query+'"...')
+
+	# Fetch the photos of a finished search (or a cached one)
+	# https://farm{farm-id}.staticflickr.com/{server-id}/{id}_{secret}.jpg
+	def handleSearchResults(self, query, photos):
+		if len(photos) == 0:
+			self.statusText.setText('No results found.')
+			return
+
+		# photos already in the library (or on their way) are not fetched again
+		photoUrls, fileNames, known = [], [], 0
+		for p in photos:
+			photoUrl = View.PHOTO_URL.format(**p)
+			photoId = str(p.get('id'))
+			if self.model.isKnownPhoto(photoId, photoUrl) or photoUrl in photoUrls:
+				known += 1
+				continue
+			fileName = self.model.getUniqueFileName(self.model.getUrlFileName(photoUrl), fileNames)
+			self.model.registerPhoto(photoId, fileName)
+			photoUrls.append(photoUrl)
+			fileNames.append(fileName)
+			print(photoUrl)
+		if len(photoUrls) == 0:
+			self.statusText.setText('All ' + str(known) + ' results for "' + query + '" are in the browser already.')
+			return
+
+		self.addToTagDict(fileNames)
+		self.model.addFiles(fileNames, photoUrls)	
+		self.model.requestImages(photoUrls, fileNames)
+		self.statusText.setText('Results found for "'+query+ '". Fetching...')			
+
+	def handleSearchFailed(self, query, message):
+		self.statusText.setText('Search for "'+query+'" failed: '+message)
+
+	# An image that could not be fetched, or that the Model dropped as a copy
+	# of one in the library, has no tags worth keeping. Runs after the Model's handler.
+	def handleImageDownloaded(self, job, index, fileName, data, error):
+		if self.model.getImageId(fileName) is None:
+			self.tagStore.removeImage(fileName, False)
+		if data is None:
+			print('Could not fetch ' + job.urls[index] + ': ' + error)
+
+	def handleDownloadProgress(self, job, done, total):
+		self.statusText.setText('Fetching images... (' + str(done) + ' of ' + str(total) + ')')
+
+	def handleDownloadFinished(self, job):
+		text = str(len(job.added)) + ' images added.'
+		if job.failed > 0:
+			text += ' ' + str(job.failed) + ' could not be fetched.'
+		self.statusText.setText(text)
+		self.setFocus()
+
+	# Stop the running search and the downloads of earlier ones
+	def cancelSearch(self):
+		searching = self.flickr.isSearching() or self.model.isDownloading()
+		self.flickr.cancel()
+		for fileName in self.model.cancelDownloads():
+			self.tagStore.removeImage(fileName, False)
+		if searching:
+			self.statusText.setText('Search cancelled.')
+
+	# Add the next chunk of files from the discovery generator, one chunk
+	# per pass of the event loop until it is exhausted
+	def discoverFiles(self):
+		if self.discovery is None:
+			return
+		chunk = list(itertools.islice(self.discovery, View.DISCOVERY_CHUNK))
+		if len(chunk) < View.DISCOVERY_CHUNK:
+			self.discovery = None
+		else:
+			QTimer.singleShot(0, self.discoverFiles)
+		new = [f for f in chunk if not self.model.hasFile(f)]
+		self.model.addLocalFiles(new)
+		self.tagStore.loadImages(new)
+		self.draw()
+
+	# Apply a batch of files added, changed or removed by other programs.
+	# Downloads that are not saved yet stay, they do not need the file.
+	def handleLibraryChanged(self, directory, added, changed, removed):
+		if directory == View.DATA_DIR:
+			selectedIndex = self.model.getSelectedIndex()
+			selected = self.model.getFile(selectedIndex)
+			gone = [f for f in removed if self.model.hasFile(f) and self.model.getSource(f) is None]
+			self.model.forgetImages(gone)
+			for fileName in gone:
+				self.tagStore.removeImage(fileName, False)
+			for fileName in changed:
+				if self.model.hasFile(fileName):
+					self.model.reloadImage(fileName)
+			new = [
+				f for f in added
+				if not self.model.hasFile(f) and not f.startswith('.') and self.scanner.isImage(os.path.join(View.DATA_DIR, f))
+			]
+			self.model.addLocalFiles(new)
+			self.tagStore.addImages(new)
+			self.tagStore.reloadImages(new)
+
+			index = self.model.getIndex(selected) if selected is not None else None
+			if index is None:
+				index = min(selectedIndex, self.model.getImageCount() - 1)
+			if index != selectedIndex:
+				self.model.setSelectedIndex(index)
+				self.model.setLeftmostIndex(index - 2)
+			if self.statusText is not None and (len(new) > 0 or len(gone) > 0):
+				self.statusText.setText(str(len(new)) + ' images added, ' + str(len(gone)) + ' removed.')
 		else:
-			self.statusText.setText('No results found.')		
+			names = [f[:-len('.txt')] for f in added + changed + removed if f.endswith('.txt')]
+			if len(self.tagStore.reloadImages(names)) == 0:
+				return
+		self.draw()
 
-	# Update the Tag Dictionary
+	# Update the Tag Store with new images
 	def addToTagDict(self, items):
-		for item in items:
-			self.tagDict.update( { item: [] } )	
+		self.tagStore.addImages(items)
 
-	# Pre-load all tags for each image into a dictionary
+	# Pre-load all tags for each image into the Tag Store, once
+	@Stats.stats.timed('View.initTags')
 	def initTags(self):
-		# self.tagDict is all the tags, self.tags is the currently displayed tags
-		self.tagDict, self.tags = {}, []
-		# create a dict { imgFileName1: [tag1, tag2], ... }
-		imgFileNames = self.model.getFiles()
-		self.tagDict = {name: [] for name in imgFileNames}
-
-		tagFileNames = os.listdir('tags')
-		for f in tagFileNames:
-			file = open('tags/' + f, 'r')
-			fNameNoExt = f[0:f.find('.txt')]
-			for imgName in imgFileNames:
-				if imgName == fNameNoExt:
-					tags = file.readlines()
-					tags = [x.strip() for x in tags] 
-					for tag in tags:
-						self.tagDict[imgName].append(tag)
-			file.close()								
-
-	# Displays all tags for currently selected image
-	def showTags(self):
+		# self.tagStore is all the tags, self.tags is a pool of tag labels
+		# of which the first self.tagsShown display the selected image's tags
 		self.tags = []
+		self.tagsShown = 0
+		self.tagStore.load(self.model.getFiles())
+
+	# Narrow the browser to the images matching the tag query in the filter text box,
+	# e.g. 'sunset AND (beach OR "golden gate") NOT night'. An empty query shows all images.
+	def applyFilter(self):
+		text = self.filterTextBox.text().strip()
+		if text == '':
+			self.clearFilter()
+		else:
+			try:
+				matches = self.tagStore.query(text)
+			except ValueError as e:
+				self.statusText.setText('Invalid tag filter: ' + str(e))
+				return
+			self.model.setOrder(self.model.sortByPosition(matches))
+			self.statusText.setText(str(self.model.getImageCount()) + ' images match "' + text + '".')
+		self.setFocus()
+		self.draw()
+
+	def clearFilter(self):
+		if self.model.isFiltered():
+			selected = self.model.getFile(self.model.getSelectedIndex())
+			self.model.setOrder(None)
+			index = self.model.getLibraryIndex(selected)
+			if index is not None:
+				self.model.setSelectedIndex(index)
+				self.model.setLeftmostIndex(index - 2)
+			self.statusText.setText('')
+		if len(self.thumbModeComponents) > 0:
+			self.filterTextBox.setText('')
+
+	# The selected image if it can be compared with the others, which starts
+	# indexing the library the first time
+	def getSimilarityTarget(self):
+		if not self.model.canFindSimilar():
+			self.statusText.setText('Finding similar images requires NumPy.')
+			return None
+		self.model.indexFeatures()
+		fileName = self.model.getFile(self.model.getSelectedIndex())
+		if not self.model.isIndexed(fileName):
+			self.statusText.setText('Indexing images... try again in a moment.')
+			return None
+		return fileName
+
+	def getIndexingNote(self):
+		return ' Still indexing the library, some images are missing.' if self.model.isIndexing() else ''
+
+	# Show the images most similar to the selected one, after it
+	def findSimilar(self):
+		fileName = self.getSimilarityTarget()
+		if fileName is None:
+			return
+		similar = self.model.findSimilar(fileName)
+		self.model.setOrder([fileName] + similar)
+		self.statusText.setText(str(len(similar)) + ' images similar to "' + fileName + '".' + self.getIndexingNote())
+
+	def findDuplicates(self):
+		fileName = self.getSimilarityTarget()
+		if fileName is None:
+			return
+		duplicates = self.model.findDuplicates(fileName)
+		if len(duplicates) == 0:
+			self.statusText.setText('No duplicates of "' + fileName + '" found.' + self.getIndexingNote())
+			return
+		self.model.setOrder([fileName] + duplicates)
+		self.statusText.setText(str(len(duplicates)) + ' duplicates of "' + fileName + '".' + self.getIndexingNote())
+
+	# Order the images shown by their similarity to the selected one
+	def sortBySimilarity(self):
+		fileName = self.getSimilarityTarget()
+		if fileName is None:
+			return
+		self.model.setOrder(self.model.sortBySimilarity(fileName))
+		self.statusText.setText('Sorted by similarity to "' + fileName + '".' + self.getIndexingNote())
+
+	def handleIndexProgress(self, done, total):
+		if not self.model.isIndexing() and self.model.getMode() != 1:
+			self.statusText.setText('All ' + str(total) + ' images are indexed for finding similar images.')
+
+	# Displays all tags for currently selected image. Labels are reused from
+	# the pool, which only grows to the largest number of tags shown at once.
+	def showTags(self):
 		padding = 24 # self.model.getFullBorder()
+		taglist = []
 		if self.model.getImageCount() > 0:
 			# tag key is the image filename
-			currTagKey = self.model.getFiles()[self.model.getSelectedIndex()]
-
-			for i in range(len(self.tagDict[currTagKey])):
-				self.tags.append(QLabel(self.tagDict[currTagKey][i], self))
-				self.tags[i].setObjectName('tag')					
-				self.tags[i].move(padding/4, padding/4 + padding*i*1.4)
+			currTagKey = self.model.getFile(self.model.getSelectedIndex())
+			taglist = self.tagStore.getTags(currTagKey)
+
+		for i in range(len(taglist)):
+			if i == len(self.tags):
+				tag = QLabel(self)
+				tag.setObjectName('tag')
+				tag.move(int(padding/4), int(padding/4 + padding*i*1.4))
+				self.tags.append(tag)
+			if self.tags[i].text() != taglist[i]:
+				self.tags[i].setText(taglist[i])
+				self.tags[i].adjustSize()
+			if self.tags[i].isHidden():
 				self.tags[i].show()
+		for t in self.tags[len(taglist):self.tagsShown]:
+			t.hide()
+		self.tagsShown = len(taglist)
 
 	def hideTags(self):
-		for t in self.tags:
+		for t in self.tags[:self.tagsShown]:
 			t.hide()
-		self.tags = []
+		self.tagsShown = 0
 
 	# Writes tags to files with .txt appended to the image name
 	# For example, if image filename is Test0.png then tag filename is Test0.png.txt
+	# Only images whose tags changed since the last save are written.
+	@pyqtSlot()
+	@Stats.stats.timed('View.saveTags')
 	def saveTags(self):
-		for filename, taglist in self.tagDict.items():
-			if len(taglist) > 0:
-				file = open('tags/' + filename + '.txt', 'w')
-				for i, tag in enumerate(taglist):
-					tag = tag.strip('\n')
-					if i != (len(taglist) - 1):
-						file.write(tag + '\n')
-					else:
-						file.write(tag)
-				file.close()
+		self.autosaveTimer.stop()
+		return self.tagStore.save()
 
 	# Creates a tag for current image from textbox
 	def addTag(self):
 		textBoxStr = self.tagTextBox.text()	
 		if textBoxStr != "":
 			# add to list of tags for current image
-			currTagKey = self.model.getFiles()[self.model.getSelectedIndex()]
-			self.tagDict[currTagKey].append(textBoxStr)
+			currTagKey = self.model.getFile(self.model.getSelectedIndex())
+			self.tagStore.addTag(currTagKey, textBoxStr)
+			if View.AUTOSAVE_TAGS_MS > 0:
+				self.autosaveTimer.start(View.AUTOSAVE_TAGS_MS)
 
 		self.showTags()
 		self.tagTextBox.setText('')
 		self.setFocus()
 
 	# Type is 0=short, 1=medium, 2=long
-	def playSound(self, soundType = 0):
-		if self.audioOn:
-			if soundType == 0:
-				soundFile = 'short.wav'
-			elif soundType == 1:
-				soundFile = 'medium.wav'
-			elif soundType == 2:
-				soundFile = 'long.wav'
-
-			self.sound = QSoundEffect()
-			self.sound.setSource(QUrl.fromLocalFile(os.path.join('audio', soundFile)))
-			self.sound.setLoopCount(1)
-			self.sound.play()	
+	# Sounds of auto-repeated keys are thinned out to one per REPEAT_SOUND_MS
+	def playSound(self, soundType = 0, repeat = False):
+		if not self.audioOn:
+			return
+		now = time.monotonic()
+		if repeat and (now - self.lastSound) * 1000 < View.REPEAT_SOUND_MS:
+			return
+		self.lastSound = now
+		self.sounds.play(soundType)
 
 	def mute(self):
 		self.audioOn = not self.audioOn
@@ -318,6 +637,7 @@ class View(QWidget):
 	def mouseSel(self, label):
 		if self.model.getMode() == 0:
 			self.model.setMode(1)
+			self.returnMode = 0
 			self.playSound(1)
 			self.model.setSelectedIndex(label.getPixIndex())
 		self.setFocus()
@@ -330,27 +650,48 @@ class View(QWidget):
 		thumb, full = 0, 1
 		short, medium, big = 0, 1, 2
 		tab, esc, enter = 16777217, 16777216, 16777220
+		grid, gridKey = 2, 71
+		similarKey, duplicatesKey, sortKey = 70, 68, 83
 		currentMode,selected,leftmost = self.model.getMode(),self.model.getSelectedIndex(),self.model.getLeftmostIndex()
 		hasImages, imgCount = self.model.getImageCount() > 0, self.model.getImageCount()
 		# print(event.key())
+		# a held key sends auto-repeated events, faster than images can be decoded
+		repeat = event.isAutoRepeat()
+		if repeat:
+			self.model.setScrolling(True)
+			self.scrollTimer.start(View.SCROLL_SETTLE_MS)
 
 		# Enter Full Screen Mode
 		if currentMode == thumb and event.key() == up and hasImages:
 			self.model.setMode(full)
-			self.playSound(medium)
+			self.returnMode = thumb
+			self.prefetcher.navigated(full, 0)
+			self.playSound(medium, repeat)
 		# Exit Full Screen Mode			
 		elif currentMode == full and event.key() == down and hasImages:
+			self.model.setMode(self.returnMode)
+			if self.returnMode == thumb:
+				self.model.setLeftmostIndex(selected - 2)
+			self.playSound(medium, repeat)
+		# Switch between the thumbnail strip and the grid of the whole library
+		elif currentMode == thumb and event.key() == gridKey:
+			self.model.setMode(grid)
+			self.playSound(medium, repeat)
+		elif currentMode == grid and event.key() == gridKey:
 			self.model.setMode(thumb)
 			self.model.setLeftmostIndex(selected - 2)
-			self.playSound(medium)
+			self.playSound(medium, repeat)
+			self.setFocus()
 		# Left - Full Screen
 		elif currentMode == full and event.key() == left and hasImages:
 			self.model.setSelectedIndex(selected - 1)
-			self.playSound(short)
+			self.prefetcher.navigated(full, -1)
+			self.playSound(short, repeat)
 		# Right - Full Screen		
 		elif currentMode == full and event.key() == right and hasImages:
 			self.model.setSelectedIndex(selected + 1)
-			self.playSound(short)
+			self.prefetcher.navigated(full, 1)
+			self.playSound(short, repeat)
 		# Left - Thumbnail
 		elif currentMode == thumb and event.key() == left and hasImages:
 			newIndex = (selected - 1) % imgCount
@@ -360,7 +701,7 @@ class View(QWidget):
 					leftmost - (View.THUMB_QTY if View.THUMB_QTY <= imgCount else imgCount)
 				)
 			self.model.setSelectedIndex(newIndex)
-			self.playSound(short)
+			self.playSound(short, repeat)
 		# Right - Thumbnail		
 		elif currentMode == thumb and event.key() == right and hasImages:
 			newIndex = (selected + 1) % imgCount
@@ -371,93 +712,108 @@ class View(QWidget):
 					leftmost + (View.THUMB_QTY if View.THUMB_QTY <= imgCount else imgCount)
 				)
 			self.model.setSelectedIndex(newIndex)
-			self.playSound(short)
+			self.playSound(short, repeat)
 		# Next set Left - Thumbnail		
 		elif currentMode == thumb and event.key() == scrollL and hasImages:
 			newIndex = (selected - View.THUMB_QTY) % imgCount
 			self.model.setSelectedIndex(newIndex)
 			self.model.setLeftmostIndex(newIndex)
-			self.playSound(big)
+			self.prefetcher.navigated(thumb, -View.THUMB_QTY)
+			self.playSound(big, repeat)
 		# Next set Right - Thumbnail		
 		elif currentMode == thumb and event.key() == scrollR and hasImages:
 			newIndex = (selected + View.THUMB_QTY) % imgCount
 			self.model.setSelectedIndex(newIndex)
 			self.model.setLeftmostIndex(newIndex)
-			self.playSound(big)
+			self.prefetcher.navigated(thumb, View.THUMB_QTY)
+			self.playSound(big, repeat)
 		elif currentMode == full and event.key() == enter:
 			self.addTag()
 		# Search for images when user hits Enter key
 		elif currentMode == thumb and event.key() == enter and self.searchTextBox.text() != '':
 			self.search()
-
-		# After user event update the view
-		self.draw()	
+		# Stop searching and fetching images
+		elif event.key() == esc:
+			self.cancelSearch()
+		# Show the images that look like the selected one
+		elif event.key() == similarKey and hasImages:
+			self.findSimilar()
+		elif event.key() == duplicatesKey and hasImages:
+			self.findDuplicates()
+		elif event.key() == sortKey and hasImages:
+			self.sortBySimilarity()
+
+		# After user event update the view with the next frame, so a burst of
+		# key events costs one draw
+		self.scheduleDraw()
 
 	def showWindowComponents(self):
 		if len(self.windowComponents) == 0:
 			self.infoBox = QLabel(self)
-			self.infoBox.resize(150, 35)
-			self.infoBox.move(self.model.getWindowWidth()- 155, 5)
 			self.infoBox.setAlignment(Qt.AlignCenter)
 			self.infoBox.setObjectName('info_box')
 
 			self.muteButton = QPushButton('Mute', self)
 			self.muteButton.clicked.connect(self.mute)
 			self.muteButton.setObjectName('mute_button')
-			self.muteButton.resize(85, 35)
-			self.muteButton.move(self.model.getWindowWidth()- 90, 45)		
+
+			# live stats need a larger info box, refreshed while idle too
+			if Stats.stats.enabled:
+				self.statsTimer = QTimer(self)
+				self.statsTimer.timeout.connect(self.updateInfoBox)
+				self.statsTimer.start(500)
 
 			self.windowComponents.extend([self.infoBox, self.muteButton])
+			self.layoutWindowComponents()
 		
 		for c in self.windowComponents:
 			c.show()
 
+	# Size & place the window components for the current window size
+	def layoutWindowComponents(self):
+		if len(self.windowComponents) == 0:
+			return
+		if Stats.stats.enabled:
+			self.infoBox.resize(250, 110)
+			self.infoBox.move(self.model.getWindowWidth()- 255, 5)
+			self.muteButton.resize(85, 35)
+			self.muteButton.move(self.model.getWindowWidth()- 90, 120)
+		else:
+			self.infoBox.resize(150, 35)
+			self.infoBox.move(self.model.getWindowWidth()- 155, 5)
+			self.muteButton.resize(85, 35)
+			self.muteButton.move(self.model.getWindowWidth()- 90, 45)		
+
 	def hideWindowComponents(self):
 		for c in self.windowComponents:
 			c.hide()
 
 	# Display Thumbnail Mode components such as search, exit, delete, etc.
 	def showThumbModeComponents(self):
-		windowWidth = self.model.getWindowWidth()
-		windowHeight = self.model.getWindowHeight()	
-		padding = windowWidth / 25 if windowWidth / 25 < 35 else 35
-
 		# Create components if necessary
 		if len(self.thumbModeComponents) == 0:
 
 			self.thumbContainer = QLabel(self)
-			self.thumbContainer.resize(windowWidth - padding/2, windowHeight/4)
-			self.thumbContainer.move(padding/4, windowHeight - windowHeight/4 - 5)
 			self.thumbContainer.setObjectName('thumb_container')
 
 			# Elements requiring API Key
 			if len(self.apiKey) > 0:
 				self.searchTextBox = QLineEdit(self)	
-				self.searchTextBox.resize(windowWidth/3, padding*1.3)
-				self.searchTextBox.move(padding, windowHeight - padding*4)
 				self.searchTextBox.setObjectName('text_box')			
 				self.searchTextBox.setPlaceholderText('Search Flickr...')
 				self.maxResultBox = QLineEdit(self)	
-				self.maxResultBox.resize(windowWidth/15, padding*1.3)
-				self.maxResultBox.move(windowWidth/1.6, windowHeight - padding*4)
 				self.maxResultBox.setObjectName('text_box')
 
 				self.maxResultBox.setText(str(int(View.MAX_RESULTS / 2)))
 				self.maxResultLabel = QLabel(self)
-				self.maxResultLabel.resize(windowWidth/6, padding*1.3)
-				self.maxResultLabel.move(windowWidth/1.4, windowHeight - padding*4)
 				self.maxResultLabel.setText('Max Search Results')
 				self.maxResultLabel.setObjectName('max_result_label')
 
 				self.searchButton = QPushButton('Search', self)
 				self.searchButton.clicked.connect(self.search)
-				self.searchButton.resize(padding*2.6, padding)
-				self.searchButton.move(windowWidth/2.5, windowHeight - padding*3.8)
 				self.searchButton.setObjectName('btn')
 				self.testButton = QPushButton('Test', self)
 				self.testButton.clicked.connect(self.test)
-				self.testButton.resize(padding*2.9, padding)
-				self.testButton.move(padding, windowHeight - padding*2)
 				self.testButton.setObjectName('btn')
 
 				self.thumbModeComponents.extend([
@@ -467,47 +823,72 @@ class View(QWidget):
 			# Elements not dependent on API Key
 			self.saveAllButton = QPushButton('Save', self)
 			self.saveAllButton.clicked.connect(self.saveAll)
-			self.saveAllButton.resize(padding*2.9, padding)
-			self.saveAllButton.move(padding+padding*2.9, windowHeight - padding*2)
 			self.saveAllButton.setObjectName('btn')
 			self.exitButton = QPushButton('Exit', self)
 			self.exitButton.clicked.connect(self.exit)
-			self.exitButton.resize(padding*2.9, padding)
-			self.exitButton.move(padding+2*padding*2.9, windowHeight - padding*2)
 			self.exitButton.setObjectName('btn')
 			self.deleteButton = QPushButton('Delete', self)
 			self.deleteButton.clicked.connect(self.delete)
-			self.deleteButton.resize(padding*2.9, padding)
-			self.deleteButton.move(padding+3*padding*2.9, windowHeight - padding*2)
 			self.deleteButton.setObjectName('btn')
 
+			self.filterTextBox = QLineEdit(self)
+			self.filterTextBox.setObjectName('text_box')
+			self.filterTextBox.setPlaceholderText('Filter by tags...')
+			self.filterTextBox.returnPressed.connect(self.applyFilter)
+
 			self.statusText = QLabel(self)
-			self.statusText.resize(windowWidth-padding*8, padding)
-			self.statusText.move(padding, windowHeight - padding)		
 
 			self.thumbModeComponents.extend([
-				self.saveAllButton, self.exitButton, self.deleteButton, self.statusText, self.thumbContainer
+				self.saveAllButton, self.exitButton, self.deleteButton, self.filterTextBox, self.statusText, self.thumbContainer
 			])
+			self.layoutThumbModeComponents()
 
 		for t in self.thumbModeComponents:
 			t.show()
 
+	def layoutThumbModeComponents(self):
+		if len(self.thumbModeComponents) == 0:
+			return
+		windowWidth = self.model.getWindowWidth()
+		windowHeight = self.model.getWindowHeight()	
+		padding = windowWidth // 25 if windowWidth / 25 < 35 else 35
+
+		self.thumbContainer.resize(int(windowWidth - padding/2), int(windowHeight/4))
+		self.thumbContainer.move(int(padding/4), int(windowHeight - windowHeight/4 - 5))
+
+		if len(self.apiKey) > 0:
+			self.searchTextBox.resize(int(windowWidth/3), int(padding*1.3))
+			self.searchTextBox.move(padding, int(windowHeight - padding*4))
+			self.maxResultBox.resize(int(windowWidth/15), int(padding*1.3))
+			self.maxResultBox.move(int(windowWidth/1.6), int(windowHeight - padding*4))
+			self.maxResultLabel.resize(int(windowWidth/6), int(padding*1.3))
+			self.maxResultLabel.move(int(windowWidth/1.4), int(windowHeight - padding*4))
+			self.searchButton.resize(int(padding*2.6), padding)
+			self.searchButton.move(int(windowWidth/2.5), int(windowHeight - padding*3.8))
+			self.testButton.resize(int(padding*2.9), padding)
+			self.testButton.move(padding, int(windowHeight - padding*2))
+
+		self.saveAllButton.resize(int(padding*2.9), padding)
+		self.saveAllButton.move(int(padding+padding*2.9), int(windowHeight - padding*2))
+		self.exitButton.resize(int(padding*2.9), padding)
+		self.exitButton.move(int(padding+2*padding*2.9), int(windowHeight - padding*2))
+		self.deleteButton.resize(int(padding*2.9), padding)
+		self.deleteButton.move(int(padding+3*padding*2.9), int(windowHeight - padding*2))
+		self.filterTextBox.resize(int(windowWidth/3.5), padding)
+		self.filterTextBox.move(int(padding*1.5 + 4*padding*2.9), int(windowHeight - padding*2))
+		self.statusText.resize(int(windowWidth-padding*8), padding)
+		self.statusText.move(padding, windowHeight - padding)		
+
 	def hideThumbModeComponents(self):
 		for t in self.thumbModeComponents:
 			t.hide()
 
 	# Show Full Screen mode components such as textbox, buttons, and tags
 	def showFullModeComponents(self):
-		windowWidth = self.model.getWindowWidth()
-		windowHeight = self.model.getWindowHeight()
-		padding = windowWidth / 25 if windowWidth / 25 < 35 else 35
-		
 		# create components if necessary
 		if len(self.fullModeComponents) == 0:
 			
 			self.tagTextBox = QLineEdit(self)	
-			self.tagTextBox.resize(windowWidth/3, padding*1.3)
-			self.tagTextBox.move(padding, windowHeight - padding*2)
 			self.tagTextBox.setPlaceholderText('Enter tag text...')
 			self.tagTextBox.setObjectName('text_box')
 
@@ -515,25 +896,78 @@ class View(QWidget):
 			self.saveTagsButton = QPushButton('Save All Tags', self)
 			self.addButton.clicked.connect(self.addTag)
 			self.saveTagsButton.clicked.connect(self.saveTags)
-			self.addButton.resize(padding*2.6, padding)
-			self.saveTagsButton.resize(padding*3.3, padding)
 			self.addButton.setObjectName('btn')
 			self.saveTagsButton.setObjectName('btn')
 
-			self.addButton.move(windowWidth/2, windowHeight - padding*1.7)
-			self.saveTagsButton.move(windowWidth/1.5, windowHeight - padding*1.7)
-
 			self.fullModeComponents.extend([
 				self.tagTextBox, self.addButton, self.saveTagsButton
 			])
+			self.layoutFullModeComponents()
 		
 		for t in self.fullModeComponents:
 			t.show()
 
+	def layoutFullModeComponents(self):
+		if len(self.fullModeComponents) == 0:
+			return
+		windowWidth = self.model.getWindowWidth()
+		windowHeight = self.model.getWindowHeight()
+		padding = windowWidth // 25 if windowWidth / 25 < 35 else 35
+
+		self.tagTextBox.resize(int(windowWidth/3), int(padding*1.3))
+		self.tagTextBox.move(padding, int(windowHeight - padding*2))
+		self.addButton.resize(int(padding*2.6), padding)
+		self.saveTagsButton.resize(int(padding*3.3), padding)
+		self.addButton.move(int(windowWidth/2), int(windowHeight - padding*1.7))
+		self.saveTagsButton.move(int(windowWidth/1.5), int(windowHeight - padding*1.7))
+
 	def hideFullModeComponents(self):
 		for t in self.fullModeComponents:
 			t.hide()
 
+	# Display Grid Mode components: the grid of every image in the library
+	def showGridModeComponents(self):
+		if len(self.gridModeComponents) == 0:
+			self.grid = GridView.GridView(self.model, self, View.THUMB, View.SEL)
+			self.grid.moved.connect(self.gridMoved)
+			self.grid.opened.connect(self.gridOpened)
+			self.gridModeComponents.append(self.grid)
+			self.layoutGridModeComponents()
+
+		for g in self.gridModeComponents:
+			g.show()
+		self.grid.setFocus()
+
+	def layoutGridModeComponents(self):
+		if len(self.gridModeComponents) == 0:
+			return
+		windowWidth = self.model.getWindowWidth()
+		windowHeight = self.model.getWindowHeight()
+		padding = windowWidth // 25 if windowWidth / 25 < 35 else 35
+		# below the info box & mute button
+		top = self.muteButton.y() + self.muteButton.height() + 5
+
+		self.grid.resize(windowWidth - padding, windowHeight - top - padding // 2)
+		self.grid.move(padding // 2, top)
+
+	def hideGridModeComponents(self):
+		for g in self.gridModeComponents:
+			g.hide()
+
+	def gridMoved(self, index):
+		self.playSound(0, True)
+		self.updateInfoBox()
+
+	# Full screen on the image double clicked or entered in the grid
+	def gridOpened(self, index):
+		self.model.setSelectedIndex(index)
+		self.model.setMode(1)
+		self.returnMode = 2
+		self.prefetcher.navigated(1, 0)
+		self.playSound(1)
+		self.setFocus()
+		self.draw()
+
 	# Opens css stylesheet and applies it to Imagebrowser elements
 	def loadStyles(self):
 		style = ''
@@ -543,15 +977,37 @@ class View(QWidget):
 				# print(line)
 		self.setStyleSheet(style)
 
-	# Hide any visible contents on browser window
+	# Switch the visible components when the mode changed since the last draw
 	def clearBrowser(self):
-		for i in range(View.THUMB_QTY + 1):
-			self.labels[i].hide()
-		self.hideTags()
-		self.hideThumbModeComponents()
-		self.hideFullModeComponents()
+		mode = self.model.getMode()
+		if mode != self.drawnMode:
+			if mode == 0:
+				self.hideFullModeComponents()
+				self.hideGridModeComponents()
+				self.showThumbModeComponents()
+			elif mode == 1:
+				self.hideThumbModeComponents()
+				self.hideGridModeComponents()
+				self.showFullModeComponents()
+			else:
+				self.hideThumbModeComponents()
+				self.hideFullModeComponents()
+				self.showGridModeComponents()
+			self.drawnMode = mode
+		if mode != 1:
+			self.hideTags()
 		self.confirmedExit = False
-		self.infoBox.setText(
-			'Image '+str(self.model.getSelectedIndex())+' of '+ str(self.model.getImageCount())
-		)					
+		self.updateInfoBox()
+
+	def updateInfoBox(self):
+		text = 'Image '+str(self.model.getSelectedIndex())+' of '+ str(self.model.getImageCount())
+		if Stats.stats.enabled:
+			stats = Stats.stats
+			text += (
+				'\ndraw p50 %.1f p99 %.1f ms' % (stats.percentile('View.draw', 0.5) * 1000, stats.percentile('View.draw', 0.99) * 1000)
+				+ '\ndecode queue %d' % self.model.decoder.getQueueDepth()
+				+ '\npixmaps %.1f MB' % (self.model.getResidentBytes() / 1048576)
+				+ '\nnet %.1f MB  %.0f ms' % (stats.getCount('net.bytes') / 1048576, stats.percentile('net.image', 0.5) * 1000)
+			)
+		self.infoBox.setText(text)
 
@@ -0,0 +1,296 @@
+# File: benchmark.py
+# Usage: QT_QPA_PLATFORM=offscreen python3 benchmark.py [--sizes 100,1000,10000,50000] [--output results.json]
+# System: OS X
+# Dependencies: Python3, PyQt5
+# Description: Headless benchmark suite for the image browser. Generates synthetic
+#		image libraries (varied sizes & formats, with tag files) and runs View/Model
+#		on them under the offscreen Qt platform. Reports cold & warm startup
+#		(first screen and all files discovered), keypress -> next frame latency
+#		for each navigation key, search result ingest from a local stand-in Flickr
+#		server and peak RSS, as JSON so that runs on different commits can be
+#		compared. Each library size runs in its own
+#		process so peak RSS is measured per size.
+
+
+import os, sys, json, time, shutil, random, argparse, platform, resource, subprocess, tempfile, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SIZES = [100, 1000, 10000, 50000]
+# (width, height) of generated images and how often each one is used
+DIMENSIONS = [((320, 240), 4), ((800, 600), 4), ((600, 800), 2), ((1600, 1200), 2), ((4000, 3000), 1)]
+FORMATS = [('jpg', 'JPG'), ('jpg', 'JPG'), ('png', 'PNG'), ('bmp', 'BMP'), ('tif', 'TIFF')]
+KEY_PRESSES = 50
+SEARCH_RESULTS = 20
+TIMEOUT = 120
+
+
+def percentiles(samples):
+	samples = sorted(samples)
+	if len(samples) == 0:
+		return {}
+	pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]
+	return {
+		'n': len(samples), 'mean': sum(samples) / len(samples),
+		'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99), 'max': samples[-1]
+	}
+
+
+# Images are generated once per library size and reused by later runs
+def makeCorpus(directory, size):
+	from PyQt5.QtGui import QImage, QColor, QPainter
+	random.seed(size)
+	dataDir, tagDir = os.path.join(directory, 'data'), os.path.join(directory, 'tags')
+	done = os.path.join(directory, '.complete')
+	# corpora of older versions may be missing files
+	if os.path.exists(done) and len(os.listdir(dataDir)) == size:
+		return
+	os.makedirs(dataDir, exist_ok=True)
+	os.makedirs(tagDir, exist_ok=True)
+
+	dims = [d for d, weight in DIMENSIONS for _ in range(weight)]
+	words = ['sun', 'beach', 'night', 'city', 'cat', 'dog', 'tree', 'snow', 'red', 'blue']
+	# a few distinct images are enough, the decoder cannot tell they repeat
+	templates = {}
+	for i in range(size):
+		w, h = dims[i % len(dims)]
+		ext, fmt = FORMATS[i % len(FORMATS)]
+		key = (w, h, i % 7)
+		if key not in templates:
+			image = QImage(w, h, QImage.Format_RGB32)
+			image.fill(QColor.fromHsv((i * 47) % 360, 160, 200))
+			painter = QPainter(image)
+			for _ in range(20):
+				painter.fillRect(
+					random.randrange(w), random.randrange(h), random.randrange(1, w // 2), random.randrange(1, h // 2),
+					QColor.fromHsv(random.randrange(360), 200, random.randrange(256))
+				)
+			painter.end()
+			templates[key] = image
+		name = 'img%06d.%s' % (i, ext)
+		if not templates[key].save(os.path.join(dataDir, name), fmt):
+			raise RuntimeError('Could not write ' + name + ' as ' + fmt)
+		if i % 3 == 0:
+			with open(os.path.join(tagDir, name + '.txt'), 'w') as f:
+				f.write('\n'.join(random.sample(words, 3)))
+
+	for name in ('style.css',):
+		shutil.copy(os.path.join(ROOT, name), directory)
+	shutil.copytree(os.path.join(ROOT, 'audio'), os.path.join(directory, 'audio'), dirs_exist_ok=True)
+	open(done, 'w').close()
+
+
+# Local stand-in for the Flickr REST API and photo farm
+class StandInHandler(BaseHTTPRequestHandler):
+
+	images = {}
+
+	def log_message(self, *args):
+		pass
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		if url.path == '/rest':
+			query = parse_qs(url.query)
+			count = int(query.get('per_page', ['1'])[0])
+			photos = [{'id': str(900000 + i), 'farm': 1, 'server': 'bench', 'secret': 's'} for i in range(count)]
+			body = json.dumps({'stat': 'ok', 'photos': {'total': str(count), 'photo': photos}}).encode('utf-8')
+			contentType = 'application/json'
+		elif url.path.startswith('/photos/'):
+			body = self.photo(int(url.path.rsplit('/', 1)[1].split('_')[0]))
+			contentType = 'image/jpeg'
+		else:
+			self.send_response(404)
+			self.end_headers()
+			return
+		self.send_response(200)
+		self.send_header('Content-Type', contentType)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def photo(self, photoId):
+		if photoId not in StandInHandler.images:
+			# trailing bytes after the JPEG end marker keep every photo distinct
+			with open(StandInHandler.template, 'rb') as f:
+				StandInHandler.images[photoId] = f.read() + str(photoId).encode('ascii')
+		return StandInHandler.images[photoId]
+
+
+def startStandInServer(template):
+	StandInHandler.template = template
+	server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server, 'http://127.0.0.1:%d' % server.server_address[1]
+
+
+def pump(app, done, timeout = TIMEOUT):
+	end = time.perf_counter() + timeout
+	while not done() and time.perf_counter() < end:
+		app.processEvents()
+		time.sleep(0.001)
+	return done()
+
+
+def firstScreenReady(view):
+	model = view.model
+	count = min(model.getImageCount(), view.THUMB_QTY)
+	leftmost = model.getLeftmostIndex()
+	return all(model.getFile((leftmost + i) % model.getImageCount()) in model.thumbs for i in range(count))
+
+
+# Construct a View the way ImageBrowser.py does and time it
+def startView(app, View, apiKeyExists):
+	import LibraryScanner
+	start = time.perf_counter()
+	view = View.View(800, LibraryScanner.LibraryScanner('data').scan(), False, apiKeyExists)
+	constructed = time.perf_counter() - start
+	pump(app, lambda: firstScreenReady(view))
+	firstScreen = time.perf_counter() - start
+	pump(app, lambda: view.discovery is None)
+	return view, constructed, firstScreen, time.perf_counter() - start
+
+
+def measureKeys(app, view):
+	from PyQt5.QtCore import Qt, QEvent
+	from PyQt5.QtGui import QKeyEvent
+	model = view.model
+	results = {}
+
+	def press(name, key, mode):
+		samples = []
+		for _ in range(KEY_PRESSES):
+			if model.getMode() != mode:
+				model.setMode(mode)
+				view.draw()
+			event = QKeyEvent(QEvent.KeyPress, key, Qt.NoModifier)
+			start = time.perf_counter()
+			view.keyPressEvent(event)
+			# the frame the key press scheduled
+			if view.frameTimer.isActive():
+				view.draw()
+			samples.append(time.perf_counter() - start)
+			app.processEvents()
+		results[name] = percentiles(samples)
+
+	press('thumb_right', Qt.Key_Right, 0)
+	press('thumb_left', Qt.Key_Left, 0)
+	press('thumb_page_right', Qt.Key_Period, 0)
+	press('thumb_page_left', Qt.Key_Comma, 0)
+	press('thumb_to_full', Qt.Key_Up, 0)
+	press('full_right', Qt.Key_Right, 1)
+	press('full_left', Qt.Key_Left, 1)
+	press('full_to_thumb', Qt.Key_Down, 1)
+	return results
+
+
+def measureSearch(app, view, View, base):
+	view.flickr.baseUrl = base + '/rest?method=flickr.photos.search&format=json&nojsoncallback=1'
+	View.View.PHOTO_URL = base + '/photos/{id}_{secret}.jpg'
+	view.flickr.cache.clear()
+	model = view.model
+	before = model.getImageCount()
+	view.model.setMode(0)
+	view.searchTextBox.setText('benchmark')
+	view.maxResultBox.setText(str(SEARCH_RESULTS))
+	start = time.perf_counter()
+	view.search()
+	arrived = pump(app, lambda: model.getImageCount() >= before + SEARCH_RESULTS)
+	ingest = time.perf_counter() - start
+	pump(app, lambda: firstScreenReady(view))
+	return {
+		'results': SEARCH_RESULTS, 'complete': arrived,
+		'ingest_s': ingest, 'displayed_s': time.perf_counter() - start
+	}
+
+
+def peakRssKb():
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# bytes on OS X, kilobytes on Linux
+	return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+# Runs in a child process, inside the corpus directory
+def runCorpus(size, workDir):
+	os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+	sys.path.insert(0, ROOT)
+	from PyQt5.QtWidgets import QApplication
+	app = QApplication([sys.argv[0]])
+	makeCorpus(workDir, size)
+	os.chdir(workDir)
+	with open('apikey-flickr', 'w') as f:
+		f.write('benchmark')
+	shutil.rmtree('cache', ignore_errors=True)
+	import View
+	View.View.AUDIO = False
+
+	result = {'size': size, 'files': len(os.listdir('data'))}
+	view, result['cold_construct_s'], result['cold_first_screen_s'], result['cold_all_files_s'] = startView(app, View, True)
+	pump(app, lambda: view.model.decoder.getQueueDepth() == 0)
+	view.close()
+	view.deleteLater()
+	app.processEvents()
+
+	view, result['warm_construct_s'], result['warm_first_screen_s'], result['warm_all_files_s'] = startView(app, View, True)
+	result['keys'] = measureKeys(app, view)
+
+	template = os.path.join('data', sorted(f for f in os.listdir('data') if f.endswith('.jpg'))[0])
+	server, base = startStandInServer(template)
+	result['search'] = measureSearch(app, view, View, base)
+	server.shutdown()
+
+	result['resident_pixmap_bytes'] = view.model.getResidentBytes()
+	result['peak_rss_kb'] = peakRssKb()
+	return result
+
+
+def gitCommit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Headless image browser benchmarks')
+	parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES), help='comma separated library sizes')
+	parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+	parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'ImageBrowser-benchmark'),
+		help='where generated libraries are kept between runs')
+	parser.add_argument('--corpus', type=int, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.corpus is not None:
+		result = runCorpus(args.corpus, os.path.join(args.workdir, str(args.corpus)))
+		print(json.dumps(result))
+		sys.stdout.flush()
+		os._exit(0)
+
+	env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+	report = {
+		'commit': gitCommit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'python': platform.python_version(), 'platform': platform.platform(), 'results': []
+	}
+	for size in [int(s) for s in args.sizes.split(',') if s]:
+		print('Benchmarking', size, 'images...', file=sys.stderr)
+		proc = subprocess.run(
+			[sys.executable, os.path.abspath(__file__), '--corpus', str(size), '--workdir', args.workdir],
+			env=env, stdout=subprocess.PIPE
+		)
+		lines = proc.stdout.decode().strip().splitlines()
+		if proc.returncode != 0 or len(lines) == 0:
+			report['results'].append({'size': size, 'error': 'exit code ' + str(proc.returncode)})
+			continue
+		report['results'].append(json.loads(lines[-1]))
+
+	output = json.dumps(report, indent=2)
+	if args.output:
+		with open(args.output, 'w') as f:
+			f.write(output + '\n')
+	else:
+		print(output)
+
+
+if __name__ == '__main__':
+	main()